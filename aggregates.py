@@ -0,0 +1,166 @@
+# aggregates.py - Memoized aggregations shared by the visualizations
+#
+# Results are computed once per data version (df.attrs['data_version'], set by
+# columnar_cache.load_columnar through set_data_version) and reused on every
+# Streamlit rerun, so widget interactions don't rerun the pandas pipeline.
+# Returned frames are shared between callers: treat them as read-only.
+#
+# pandas copies attrs onto every frame derived from a loaded one (slices,
+# filters, assign), so the version is only trusted for the very frame it was
+# set on; any other frame is keyed by a hash of its contents.
+
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+import metrics
+
+MAX_MEMO_ENTRIES = 32  # Least recently used results are evicted first
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()  # Guards _memo: lookups reorder it, stores evict from it
+_versions = {}  # id(frame) -> (weak reference to the frame, data version) for versioned frames
+
+
+def set_data_version(df, version):
+    """Records version as the data version of df itself (not of frames derived from it)."""
+    df.attrs['data_version'] = version  # Kept for readers of the loaded frame (e.g. shared_store.py)
+    key = id(df)
+    _versions[key] = (weakref.ref(df, lambda _, key=key: _versions.pop(key, None)), version)
+
+
+def data_version(df):
+    """
+    Returns the data version set on df by set_data_version, else a hash of its
+    column names, dtypes and rows in order.
+    """
+    entry = _versions.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())  # Row hashes, in order
+    return digest.hexdigest()[:24]
+
+
+def cached_result(name, version):
+    """The memoized result for (name, version), or None."""
+    with _memo_lock:
+        key = (name, version)
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    return None
+
+
+def store_result(name, version, result):
+    """Memoizes result under (name, version), e.g. after an incremental update (incremental.py)."""
+    with _memo_lock:
+        _memo[(name, version)] = result
+        while len(_memo) > MAX_MEMO_ENTRIES:
+            _memo.popitem(last=False)
+
+
+def memoized(name, df, compute):
+    """Returns compute(df), cached under (name, data version of df)."""
+    version = data_version(df)
+    metrics.count('cache_lookups', cache='memo', aggregate=name)
+    result = cached_result(name, version)
+    if result is not None:
+        return result
+    metrics.count('cache_misses', cache='memo', aggregate=name)
+    with metrics.stage('aggregate', aggregate=name):
+        result = compute(df)
+    store_result(name, version, result)
+    return result
+
+
+def clear_memo():
+    """Drops all memoized results (used by benchmarks.py to time cold computations)."""
+    with _memo_lock:
+        _memo.clear()
+
+
+# --- Weekly deaths (vis1) ---
+
+WEEKLY_VALUE_COLS = ['NoDeaths_EP', 'Expected', 'LowerB', 'UpperB', 'Diff']
+
+
+def _weekly_partial(dataframe):
+    """Per-week sums of one frame (indexed by Year, Week)."""
+    # Columns arrive typed from load_data (dialect.py drops the '#' legend lines
+    # and turns the '.' placeholders into NaN), so no numeric coercion is needed
+    value_cols = [col for col in WEEKLY_VALUE_COLS if col in dataframe.columns]
+    frame = dataframe[['Year', 'Week'] + value_cols]
+    # Sum across age groups; min_count=1 keeps weeks without any observation as NaN
+    return frame.groupby(['Year', 'Week'], sort=False).sum(min_count=1)
+
+
+def _finish_weekly(partials):
+    """Combines partial per-week sums into the sorted weekly totals frame."""
+    combined = pd.concat(partials) if len(partials) > 1 else partials[0]
+    totals = combined.groupby(level=['Year', 'Week'], sort=True).sum(min_count=1).reset_index()
+    totals['YearWeek'] = totals['Year'].astype('int64') * 100 + totals['Week']  # Integer key, sorts chronologically
+    totals['Year-Week'] = totals['Year'].astype(str) + '-W' + totals['Week'].astype(str).str.zfill(2)
+    # Monday of the ISO week; NaT for weeks that don't exist (e.g. W53 in a 52-week year)
+    totals['Date'] = pd.to_datetime(totals['Year-Week'] + '-1', format='%G-W%V-%u', errors='coerce')
+    return totals
+
+
+def _compute_weekly_totals(dataframe):
+    return _finish_weekly([_weekly_partial(dataframe)])
+
+
+class WeeklyTotalsAccumulator:
+    """Sums chunks of the weekly deaths file per week without keeping their rows (see streaming.py)."""
+
+    def __init__(self):
+        self.partial = None  # Running per-week sums, at most one row per week
+
+    def add(self, chunk):
+        if not len(chunk):
+            return
+        partial = _weekly_partial(chunk)
+        if self.partial is not None:
+            partial = pd.concat([self.partial, partial]).groupby(level=['Year', 'Week'], sort=False).sum(min_count=1)
+        self.partial = partial
+
+    def sums(self):
+        """
+        The per-week sums as a frame with one row per week ('Year', 'Week' and
+        the value columns); weekly_totals() of it equals that of the rows added.
+        """
+        return self.partial.sort_index().reset_index() if self.partial is not None else None
+
+
+def update_weekly_totals(totals, dataframe, delta):
+    """
+    weekly_totals(dataframe) computed from the totals before the rows in delta
+    were appended to (or replaced in) dataframe: only the weeks that occur in
+    delta are summed again.
+    """
+    weeks = pd.MultiIndex.from_frame(delta[['Year', 'Week']].astype('int64')).unique()
+    in_delta_weeks = pd.MultiIndex.from_frame(dataframe[['Year', 'Week']].astype('int64')).isin(weeks)
+    value_cols = [col for col in WEEKLY_VALUE_COLS if col in totals.columns]
+    kept = totals.set_index(['Year', 'Week'])[value_cols]
+    kept = kept[~kept.index.isin(weeks)]
+    return _finish_weekly([kept, _weekly_partial(dataframe[in_delta_weeks])])
+
+
+def weekly_totals(dataframe):
+    """
+    Weekly totals over all age groups, sorted by (Year, Week).
+    Columns: 'Year', 'Week', 'YearWeek' (Year * 100 + Week), 'Year-Week' label,
+    'Date' (Monday of the ISO week, for time axes; NaT if the week doesn't
+    exist in its ISO year) and the summed 'NoDeaths_EP',
+    'Expected', 'LowerB', 'UpperB' and 'Diff' (where present).
+    'NoDeaths_EP' is NaN for weeks not observed yet (future weeks with only an
+    expected value). Note that summing the per-age LowerB/UpperB only
+    approximates the band of the total. 'Diff' is the excess of the age groups
+    the FSO flagged above their expected range, NaN for weeks without any.
+    """
+    return memoized('weekly_totals', dataframe, _compute_weekly_totals)
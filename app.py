@@ -11,113 +11,143 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Data Loading Function (Keep as before, handles CSV/XLSX) ---
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# --- Data Loading (handles CSV/XLSX) ---
+# Parsing itself lives in loaders.py; columnar_cache.py keeps a typed Arrow copy
+# of every parsed file on disk so restarts and new workers skip CSV/Excel parsing.
+from loaders import DATA_DIR
+import metrics
 
 
-@st.cache_data
-def load_data(file_path, is_excel=False, specific_delimiter=None, decimal_separator='.'): # ADD decimal_separator argument, default to '.'
-    """Loads data from CSV or Excel, handling delimiters and decimal separators."""
+# Copy-on-Write lets the vis functions derive frames that share memory with the
+# cached ones instead of copying them (it is the default from pandas 3.0 on)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+# --- Dataset Registry and Lazy View Imports ---
+# datasets.py maps each dataset to its loader options and the views using it.
+# The active view's dataset is loaded first (the others are prefetched after it has
+# rendered), and visN modules are only imported when their view is shown.
+from datasets import DATASETS, VIEWS, load_view_function
+from aggregates import weekly_totals
+from incremental import latest
+from figure_cache import FigureCache
+from shared_store import SharedStore
+from async_loader import BackgroundLoader
+from cube import region_cube, region_totals_check
+from region_query import GEO_NAMES, SEX_NAMES, age_label
+
+
+# --- Background Loading ---
+# The loader pool and its frames are shared by every session (st.cache_resource);
+# the frames are read-only views of the memory-mapped cache files, and the vis
+# functions never modify their input. The loaders run without Streamlit calls,
+# so errors are reported here, in the script thread.
+@st.cache_resource
+def get_loader():
+    return BackgroundLoader()
+
+
+def load_data(name):
+    """
+    Returns the frame of a registered dataset, waiting for its background load
+    with a placeholder in place of the view. CSV delimiters and decimal
+    separators are detected automatically (dialect.py); large CSV files are
+    streamed in chunks, keeping only rows matching the registry's filters.
+    """
+    file_path = DATASETS[name]['file']
     full_path = os.path.join(DATA_DIR, file_path)
+    future = get_loader().submit(name)
+    placeholder = st.empty()
+    if not future.done():
+        placeholder.info(f"Loading {file_path}...")
     try:
-        if is_excel or file_path.lower().endswith('.xlsx'):
-            df = pd.read_excel(full_path)
-            file_type = "Excel"
-        elif file_path.lower().endswith('.csv'):
-            file_type = "CSV"
-            delimiter_to_use = specific_delimiter if specific_delimiter else ';' # Prioritize specific, else default to ';'
-            try:
-                # Use the specified or default delimiter AND the decimal separator
-                df = pd.read_csv(full_path, delimiter=delimiter_to_use, decimal=decimal_separator)
-            except (pd.errors.ParserError, ValueError) as e1:
-                # If the first attempt fails, and we didn't specify a delimiter, try ','
-                if not specific_delimiter and delimiter_to_use == ';':
-                    st.warning(f"Parsing {file_path} with delimiter='{delimiter_to_use}' failed ({e1}), trying with ','...")
-                    delimiter_to_use = ','
-                    try:
-                        # Try again with comma delimiter AND the specified decimal separator
-                        df = pd.read_csv(full_path, delimiter=delimiter_to_use, decimal=decimal_separator)
-                    except Exception as e2:
-                       st.error(f"Failed to parse {file_path} with delimiter=',' ({e2}) after initial failure.")
-                       return None
-                else: # Failed even with specific delimiter, or failed the fallback comma attempt
-                    st.error(f"Error parsing {file_path} with delimiter='{delimiter_to_use}' and decimal='{decimal_separator}': {e1}")
-                    return None
-            except Exception as csv_e: # Catch other CSV reading errors
-                 st.error(f"Error reading CSV {file_path}: {csv_e}")
-                 return None
-        else:
-            st.error(f"Unsupported file format: {file_path}")
-            return None
-
+        df = future.result()
         if df is None or df.empty:
              st.warning(f"Loaded empty or None dataframe from {file_path}")
              return None
-        # st.success(f"Successfully loaded {file_type}: {file_path}") # Debug print
         return df
     except FileNotFoundError:
         st.error(f"Error: Data file not found at {full_path}")
         return None
+    except (pd.errors.ParserError, ValueError) as e:
+        st.error(f"Error parsing {file_path}: {e}")
+        return None
     except Exception as e:
         st.error(f"An unexpected error occurred loading {file_path}: {e}")
         return None
+    finally:
+        placeholder.empty()
+
+
+# With DATASET_STORE_DIR set, all worker processes attach to the datasets that
+# `python shared_store.py publish` wrote there, instead of each loading its own copy
+@st.cache_resource
+def get_shared_store():
+    return SharedStore(os.environ['DATASET_STORE_DIR']) if os.environ.get('DATASET_STORE_DIR') else None
+
+
+def get_dataset(name):
+    """
+    Loads a registered dataset: from the shared store if one is configured and
+    has it, else through the background loader. If its file has changed since,
+    incremental.py parses only the new/changed rows and updates the cached
+    frame and aggregates in place (with a shared store, the publisher does that).
+    """
+    spec = DATASETS[name]
+    store = get_shared_store()
+    if store is not None:
+        try:
+            df = store.get(name)
+        except (OSError, ValueError) as e:
+            st.warning(f"Could not read {name} from the shared dataset store, loading it directly: {e}")
+            df = None
+        metrics.count('cache_lookups', cache='shared_store')
+        if df is not None:
+            return df
+        metrics.count('cache_misses', cache='shared_store')  # Not published yet, or unreadable
+    metrics.count('cache_lookups', cache='load_data')
+    with metrics.stage('load_data', dataset=name):
+        df = load_data(name)
+        if df is None:
+            return None
+        try:
+            refreshed = latest(os.path.join(DATA_DIR, spec['file']), spec['options'], df)
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            st.warning(f"Could not refresh {spec['file']}, showing the data loaded earlier: {e}")
+            return df
+        if refreshed is not df:
+            get_loader().replace(name, refreshed)  # Don't keep the superseded frame alive in its future
+        return refreshed
+
+
+# --- Instrumentation (metrics.py) ---
+# Each rerun records its stages: load_data, aggregate (memoized pandas work),
+# build_figure (create_*_plot, or the figure cache) and serialize (st.plotly_chart turns the figure
+# into JSON for the browser). METRICS_PORT=9464 serves them for Prometheus
+# (on 127.0.0.1 unless METRICS_HOST is set).
+@st.cache_resource
+def start_metrics_server(port):
+    try:
+        return metrics.start_http_server(port)
+    except OSError as e:  # E.g. another worker process already serves this port
+        print(f"Warning: not serving metrics on port {port}: {e}")
+        return None
+
+
+if os.environ.get('METRICS_PORT'):
+    start_metrics_server(int(os.environ['METRICS_PORT']))
+
+
+# --- Figure Cache ---
+# Built figures are kept as JSON per (view, filters, data version) and shared by
+# all sessions, so repeat views skip the create_*_plot functions (figure_cache.py)
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
 
-# --- Load All Required Datasets ---
-# Load data based on the identified files in the 'data' directory image
-df_weekly_deaths = load_data('Weekly_number_of_deaths.csv')                     # For Vis 1
-df_absolute_deaths = load_data('Deaths_Absolute_number.csv', specific_delimiter=',') # For Vis 2
-df_rate_100k = load_data('Mortality_rate_per_100000_inhabitants.csv', specific_delimiter=',', decimal_separator=',')# For Vis 3
-df_by_canton = load_data('Deaths_per_week_by_5-year_age_group_sex_and_canton.csv') # For Vis 4
-df_by_region = load_data('Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv')# For Vis 5
-df_causes_men = load_data('Sterbefälle_und_Sterbeziffern_wichtiger_Todesursachen_Männer_seit_1970.xlsx', is_excel=True) # For Vis 6
-
-# Optional: Load data for women's causes of death if needed later
-# df_causes_women = load_data('Sterbefälle_und_Sterbeziffern_wichtiger_Todesursachen_Frauen_seit_1970.xlsx', is_excel=True)
-
-# --- Import Visualization Functions ---
-# Use descriptive function names you intend to create in visX.py files
-
-# VIS1: Weekly Deaths
-try:
-    from vis1 import create_weekly_deaths_plot
-    VIS1_IMPORTED = True
-except ImportError:
-    VIS1_IMPORTED = False
-
-# VIS2: Absolute Deaths
-try:
-    from vis2 import create_absolute_deaths_plot # Implement this in vis2.py
-    VIS2_IMPORTED = True
-except ImportError:
-    VIS2_IMPORTED = False
-
-# VIS3: Mortality Rate
-try:
-    from vis3 import create_mortality_rate_plot # Implement this in vis3.py
-    VIS3_IMPORTED = True
-except ImportError:
-    VIS3_IMPORTED = False
-
-# VIS4: Deaths by Canton
-try:
-    from vis4 import create_canton_plot # Implement this in vis4.py
-    VIS4_IMPORTED = True
-except ImportError:
-    VIS4_IMPORTED = False
-
-# VIS5: Deaths by Major Region
-try:
-    from vis5 import create_region_plot # Implement this in vis5.py
-    VIS5_IMPORTED = True
-except ImportError:
-    VIS5_IMPORTED = False
-
-# VIS6: Causes of Death (Men)
-try:
-    from vis6 import create_causes_men_plot # Implement this in vis6.py
-    VIS6_IMPORTED = True
-except ImportError:
-    VIS6_IMPORTED = False
+figures = get_figure_cache()
 
 
 # --- Initialize Session State for Navigation ---
@@ -128,36 +158,50 @@ if 'current_view' not in st.session_state:
 st.sidebar.title("Navigation")
 st.sidebar.write("Select a visualization:")
 
-# Use more descriptive button labels based on the data
-if st.sidebar.button("Weekly Deaths"):
-    st.session_state.current_view = 'vis1'
-if st.sidebar.button("Absolute Deaths"):
-    st.session_state.current_view = 'vis2'
-if st.sidebar.button("Mortality Rate / 100k"):
-    st.session_state.current_view = 'vis3'
-if st.sidebar.button("Deaths by Canton"):
-    st.session_state.current_view = 'vis4'
-if st.sidebar.button("Deaths by Major Region"):
-    st.session_state.current_view = 'vis5'
-if st.sidebar.button("Causes of Death (Men)"):
-    st.session_state.current_view = 'vis6'
+# Use more descriptive button labels based on the data (labels live in datasets.VIEWS)
+for view_id, view in VIEWS.items():
+    if st.sidebar.button(view['label']):
+        st.session_state.current_view = view_id
+
+show_performance = st.sidebar.checkbox("Show performance panel", value=False)
 
 # --- Main Content Area ---
 st.title("Swiss Mortality Data Visualization")
 
 # Display content based on the selected view
 current_view = st.session_state.current_view
+metrics.start_run(view=current_view)
 
 # VIS 1 Display Logic
 if current_view == 'vis1':
     st.header("Weekly Deaths Overview")
-    if VIS1_IMPORTED and df_weekly_deaths is not None:
-        fig1 = create_weekly_deaths_plot(df_weekly_deaths.copy()) # Pass a copy to avoid modifying cached data
+    create_weekly_deaths_plot = load_view_function('vis1')
+    df_weekly_deaths = get_dataset('weekly_deaths') if create_weekly_deaths_plot else None  # Don't load data for a view that can't be shown
+    if create_weekly_deaths_plot and df_weekly_deaths is not None:
+        col_expected, col_excess = st.columns(2)
+        show_expected = col_expected.checkbox("Show expected range", value=False)
+        show_excess = col_excess.checkbox("Mark weeks flagged above the expected range", value=False)
+        # Narrowing the year range re-slices the full-resolution weekly totals
+        # (long ranges are downsampled in vis1 to keep the figure small)
+        try:
+            years = weekly_totals(df_weekly_deaths)['Year']
+        except (KeyError, ValueError, TypeError) as e:  # vis1 reports the problem below
+            print(f"Could not compute the weekly totals for the year slider: {e}")
+            years = None
+        year_range = None
+        if years is not None and len(years):
+            year_range = st.slider("Years", int(years.min()), int(years.max()), (int(years.min()), int(years.max())))
+        with metrics.stage('build_figure', view='vis1'):
+            fig1 = figures.figure('vis1', dict(show_expected=show_expected, year_range=year_range, show_excess=show_excess),
+                                  [df_weekly_deaths],
+                                  lambda: create_weekly_deaths_plot(df_weekly_deaths, show_expected=show_expected,
+                                                                    year_range=year_range, show_excess=show_excess))
         if fig1:
-            st.plotly_chart(fig1, use_container_width=True)
+            with metrics.stage('serialize', view='vis1'):
+                st.plotly_chart(fig1, use_container_width=True)
         else:
             st.warning("Could not generate the weekly deaths plot.")
-    elif not VIS1_IMPORTED:
+    elif not create_weekly_deaths_plot:
          st.error("Cannot display plot: Error in vis1.py.")
     else: # df_weekly_deaths is None
         st.error("Cannot display plot: Data ('Weekly_number_of_deaths.csv') failed to load.")
@@ -165,17 +209,22 @@ if current_view == 'vis1':
 # VIS 2 Display Logic
 elif current_view == 'vis2':
     st.header("Absolute Number of Deaths per Year") # Slightly more descriptive header
-    if VIS2_IMPORTED and df_absolute_deaths is not None:
+    create_absolute_deaths_plot = load_view_function('vis2')
+    df_absolute_deaths = get_dataset('absolute_deaths') if create_absolute_deaths_plot else None
+    if create_absolute_deaths_plot and df_absolute_deaths is not None:
         # --- Call the function from vis2.py ---
-        fig2 = create_absolute_deaths_plot(df_absolute_deaths.copy()) # Pass a copy
+        with metrics.stage('build_figure', view='vis2'):
+            fig2 = figures.figure('vis2', {}, [df_absolute_deaths],
+                                  lambda: create_absolute_deaths_plot(df_absolute_deaths)) # Shared read-only frame, no copy needed
         if fig2:
             # Display the plot if successfully created
-            st.plotly_chart(fig2, use_container_width=True)
+            with metrics.stage('serialize', view='vis2'):
+                st.plotly_chart(fig2, use_container_width=True)
         else:
             # Show a warning if plot creation failed inside the function
             st.warning("Could not generate the absolute deaths plot. Check data format or errors in vis2.py.")
         # --- End of updated logic for Vis 2 ---
-    elif not VIS2_IMPORTED:
+    elif not create_absolute_deaths_plot:
          st.error("Cannot display plot: vis2.py could not be imported or the function 'create_absolute_deaths_plot' is missing/has errors.")
     else: # df_absolute_deaths is None
         st.error("Cannot display plot: Data file 'Deaths_Absolute_number.csv' failed to load.")
@@ -183,34 +232,41 @@ elif current_view == 'vis2':
 # VIS 3 Display Logic
 elif current_view == 'vis3':
     st.header("Mortality Rate per 100,000 Inhabitants")
-    if VIS3_IMPORTED and df_rate_100k is not None:
+    create_mortality_rate_plot = load_view_function('vis3')
+    df_rate_100k = get_dataset('rate_100k') if create_mortality_rate_plot else None
+    if create_mortality_rate_plot and df_rate_100k is not None:
         # --- Call the function from vis3.py ---
-        fig3 = create_mortality_rate_plot(df_rate_100k.copy()) # Pass a copy
+        with metrics.stage('build_figure', view='vis3'):
+            fig3 = figures.figure('vis3', {}, [df_rate_100k],
+                                  lambda: create_mortality_rate_plot(df_rate_100k)) # Shared read-only frame, no copy needed
         if fig3:
             # Display the plot if successfully created
-            st.plotly_chart(fig3, use_container_width=True)
+            with metrics.stage('serialize', view='vis3'):
+                st.plotly_chart(fig3, use_container_width=True)
         else:
             # Show a warning if plot creation failed inside the function
             st.warning("Could not generate the mortality rate plot. Check data format or errors in vis3.py.")
         # --- End of updated logic for Vis 3 ---
-    elif not VIS3_IMPORTED:
+    elif not create_mortality_rate_plot:
          st.error("Cannot display plot: vis3.py could not be imported or the function 'create_mortality_rate_plot' is missing/has errors.")
     else: # df_rate_100k is None
-        st.error("Cannot display plot: Data file 'Mortality_rate_per_100000_inhabitants.csv' failed to load. Check delimiter/decimal settings.")
+        st.error("Cannot display plot: Data file 'Mortality_rate_per_100000_inhabitants.csv' failed to load.")
 
 # VIS 4 Display Logic
 elif current_view == 'vis4':
     st.header("Deaths per Week by Canton, Age Group, and Sex")
-    if VIS4_IMPORTED and df_by_canton is not None:
+    create_canton_plot = load_view_function('vis4')
+    df_by_canton = get_dataset('by_canton') if create_canton_plot else None
+    if create_canton_plot and df_by_canton is not None:
         # --- Replace placeholder with actual plot call when vis4.py is ready ---
-        # fig4 = create_canton_plot(df_by_canton.copy()) # Might need filters too
+        # fig4 = create_canton_plot(df_by_canton) # Might need filters too
         # if fig4:
         #     st.plotly_chart(fig4, use_container_width=True)
         # else:
         #      st.warning("Could not generate plot from vis4.py")
         st.info("Placeholder: Vis 4 Function needs to be implemented in vis4.py (likely needs filters)")
         st.dataframe(df_by_canton.head()) # Show head as placeholder
-    elif not VIS4_IMPORTED:
+    elif not create_canton_plot:
          st.error("Cannot display plot: Error in vis4.py or function missing.")
     else: # df_by_canton is None
         st.error("Cannot display plot: Data ('Deaths_per_week_by_5-year_age_group_sex_and_canton.csv') failed to load.")
@@ -218,16 +274,35 @@ elif current_view == 'vis4':
 # VIS 5 Display Logic
 elif current_view == 'vis5':
     st.header("Deaths per Week by Major Region, Age Group, and Sex")
-    if VIS5_IMPORTED and df_by_region is not None:
-        # --- Replace placeholder with actual plot call when vis5.py is ready ---
-        # fig5 = create_region_plot(df_by_region.copy()) # Might need filters too
-        # if fig5:
-        #     st.plotly_chart(fig5, use_container_width=True)
-        # else:
-        #      st.warning("Could not generate plot from vis5.py")
-        st.info("Placeholder: Vis 5 Function needs to be implemented in vis5.py (likely needs filters)")
-        st.dataframe(df_by_region.head()) # Show head as placeholder
-    elif not VIS5_IMPORTED:
+    create_region_plot = load_view_function('vis5')
+    df_by_region = get_dataset('by_region') if create_region_plot else None
+    if create_region_plot and df_by_region is not None:
+        # --- Filters (slices are read from the data cube in cube.py) ---
+        cube = region_cube(df_by_region)
+        col_geo, col_age, col_sex = st.columns(3)
+        geo = col_geo.multiselect("Regions", cube.labels['geo'], default=['CH'],
+                                  format_func=lambda g: f"{g} {GEO_NAMES.get(g, '')}")
+        age = col_age.multiselect("Age groups", cube.labels['age'], default=['_T'], format_func=age_label)
+        sex = col_sex.multiselect("Sex", cube.labels['sex'], default=['T'], format_func=lambda s: SEX_NAMES.get(s, s))
+        mismatches = region_totals_check(df_by_region)
+        if not mismatches.empty:
+            st.warning(f"{len(mismatches)} shipped totals (CH / all ages / both sexes) do not match the sum of their detail rows.")
+        first_year, last_year = int(cube.years.min()), int(cube.years.max())
+        years = st.slider("Years", first_year, last_year, (first_year, last_year)) if first_year < last_year else None
+        # Expected deaths come from a Serfling regression over all weeks of each series (excess.py)
+        show_expected = st.checkbox("Show expected deaths (99% band) and excess weeks", value=False)
+
+        with metrics.stage('build_figure', view='vis5'):
+            fig5 = figures.figure('vis5', dict(geo=geo, age=age, sex=sex, years=years, show_expected=show_expected),
+                                  [df_by_region],
+                                  lambda: create_region_plot(df_by_region, geo=geo, age=age, sex=sex, years=years,
+                                                             show_expected=show_expected))
+        if fig5:
+            with metrics.stage('serialize', view='vis5'):
+                st.plotly_chart(fig5, use_container_width=True)
+        else:
+            st.warning("Could not generate the region plot. Select at least one region, age group and sex.")
+    elif not create_region_plot:
          st.error("Cannot display plot: Error in vis5.py or function missing.")
     else: # df_by_region is None
         st.error("Cannot display plot: Data ('Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv') failed to load.")
@@ -235,16 +310,23 @@ elif current_view == 'vis5':
 # VIS 6 Display Logic
 elif current_view == 'vis6':
     st.header("Causes of Death Since 1970 (Men)")
-    if VIS6_IMPORTED and df_causes_men is not None:
-        # --- Replace placeholder with actual plot call when vis6.py is ready ---
-        # fig6 = create_causes_men_plot(df_causes_men.copy()) # Might need filters too
-        # if fig6:
-        #     st.plotly_chart(fig6, use_container_width=True)
-        # else:
-        #      st.warning("Could not generate plot from vis6.py")
-        st.info("Placeholder: Vis 6 Function needs to be implemented in vis6.py")
-        st.dataframe(df_causes_men.head()) # Show head as placeholder
-    elif not VIS6_IMPORTED:
+    create_causes_men_plot = load_view_function('vis6')
+    df_causes_men = get_dataset('causes_men') if create_causes_men_plot else None
+    if create_causes_men_plot and df_causes_men is not None:
+        col_measure, col_sub = st.columns(2)
+        measure = col_measure.radio("Show", ['Deaths', 'Rate'], horizontal=True,
+                                    format_func=lambda m: "Number of deaths" if m == 'Deaths' else "Rate per 100,000")
+        show_sub_causes = col_sub.checkbox("Include sub-causes", value=False)
+        with metrics.stage('build_figure', view='vis6'):
+            fig6 = figures.figure('vis6', dict(measure=measure, show_sub_causes=show_sub_causes), [df_causes_men],
+                                  lambda: create_causes_men_plot(df_causes_men, measure=measure,
+                                                                 show_sub_causes=show_sub_causes))
+        if fig6:
+            with metrics.stage('serialize', view='vis6'):
+                st.plotly_chart(fig6, use_container_width=True)
+        else:
+            st.warning("Could not generate the causes of death plot. Check data format or errors in vis6.py.")
+    elif not create_causes_men_plot:
          st.error("Cannot display plot: Error in vis6.py or function missing.")
     else: # df_causes_men is None
         st.error("Cannot display plot: Data ('Sterbefälle_und_Sterbeziffern_wichtiger_Todesursachen_Männer_seit_1970.xlsx') failed to load.")
@@ -253,6 +335,28 @@ elif current_view == 'vis6':
 else:
     st.error("Something went wrong with the view selection.")
 
+# --- Prefetch ---
+# The active view is rendered; load the other views' datasets in the background so
+# switching views doesn't wait for parsing (not needed with the shared store).
+# Datasets no view uses yet (causes_women) are left to the cache compiler.
+if get_shared_store() is None:
+    get_loader().prefetch([name for name, spec in DATASETS.items() if spec['views']])
+
+# --- Performance Panel ---
+stages = metrics.finish_run()
+if show_performance:
+    st.sidebar.subheader("Performance (this rerun)")
+    if stages:
+        st.sidebar.dataframe(pd.DataFrame({
+            'Stage': [s['name'] + ''.join(f" {v}" for v in s['labels'].values()) for s in stages],
+            'ms': [round(s['seconds'] * 1000, 1) for s in stages],
+            'Peak KiB': [None if s['peak_bytes'] is None else round(s['peak_bytes'] / 1024) for s in stages],
+        }), hide_index=True)
+    cache_rows = [(cache, lookups - misses, misses) for cache, (lookups, misses) in sorted(metrics.cache_stats().items())]
+    if cache_rows:
+        st.sidebar.caption("Cache hits / misses since the server started")
+        st.sidebar.dataframe(pd.DataFrame(cache_rows, columns=['Cache', 'Hits', 'Misses']), hide_index=True)
+
 # --- Optional: Add a footer ---
 st.markdown("---")
 # st.markdown("Data source: [Provide source link if applicable]")
\ No newline at end of file
@@ -0,0 +1,70 @@
+# async_loader.py - Background loading and prefetching of the registered datasets
+#
+# app.py used to load the active view's dataset inline, so nothing below the
+# sidebar appeared until it was parsed, and every other dataset was loaded only
+# when its view was first opened. BackgroundLoader runs the plain loaders
+# (columnar_cache.load_columnar, no Streamlit calls) in a small thread pool
+# shared by all sessions: the script submits the active view's dataset, shows
+# a placeholder while it loads, and after rendering queues the remaining
+# datasets so switching views later finds them ready.
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from columnar_cache import load_columnar
+from datasets import DATASETS
+from incremental import track
+from loaders import DATA_DIR
+
+MAX_WORKERS = 2  # Loaders are mostly I/O and pyarrow/pandas C code; more threads mostly contend
+
+
+def read_dataset(name):
+    """
+    Loads a registered dataset through the columnar cache (raises on failure)
+    and registers it with incremental.py, so edits made to the file while the
+    frame waits unused (e.g. after a prefetch) are picked up when it is shown.
+    """
+    spec = DATASETS[name]
+    full_path = os.path.join(DATA_DIR, spec['file'])
+    with metrics.stage('read_dataset', dataset=name):
+        frame = load_columnar(full_path, **spec['options'])
+    track(full_path, spec['options'], frame)
+    return frame
+
+
+class BackgroundLoader:
+    """One future per dataset, loaded at most once per process (failed loads are retried on request)."""
+
+    def __init__(self, load=read_dataset, max_workers=MAX_WORKERS):
+        self._load = load
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dataset-loader')
+        self._futures = {}
+        self._lock = threading.Lock()  # Guards _futures, so each dataset is submitted once
+
+    def submit(self, name, prefetch=False):
+        """Future of the dataset's frame, starting the load if it isn't running or done yet."""
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None or (future.done() and future.exception() is not None):
+                if prefetch:
+                    metrics.count('prefetches')
+                else:
+                    metrics.count('cache_misses', cache='load_data')
+                future = self._futures[name] = self._executor.submit(self._load, name)
+            return future
+
+    def replace(self, name, frame):
+        """Makes frame the loaded result of name (e.g. after a refresh), so the superseded frame can be freed."""
+        future = Future()
+        future.set_result(frame)
+        with self._lock:
+            self._futures[name] = future
+
+    def prefetch(self, names):
+        """Queues every dataset in names whose file exists and that isn't loaded or loading."""
+        for name in names:
+            if name not in self._futures and os.path.exists(os.path.join(DATA_DIR, DATASETS[name]['file'])):
+                self.submit(name, prefetch=True)
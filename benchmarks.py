@@ -0,0 +1,234 @@
+# benchmarks.py - Headless benchmarks for loaders, aggregations and figure builders
+#
+# Runs every loader (plain parse and columnar-cache hit), the memoized
+# aggregations and each create_*_plot function, plus figure serialization to
+# JSON, against the bundled data/ files and synthetic copies scaled 10x/100x
+# (more years for the yearly/weekly files, more regions for the region file).
+# Reports median wall time, peak traced memory and JSON payload size.
+#
+#     python benchmarks.py                          # scales 1 and 10
+#     python benchmarks.py --scales 1 10 100 --save bench_baseline.json
+#     python benchmarks.py --compare bench_baseline.json   # exit 1 on regressions
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import aggregates
+import columnar_cache
+from cube import region_cube
+from datasets import DATASETS, load_view_function
+from excess import region_baseline
+from loaders import DATA_DIR, read_source
+from region_query import region_index
+
+DEFAULT_SCALES = [1, 10]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.25  # A case regresses if it gets this much slower/bigger than the baseline
+
+# Views benchmarked with their default arguments: view id -> dataset it plots
+FIGURE_VIEWS = {'vis1': 'weekly_deaths', 'vis2': 'absolute_deaths', 'vis3': 'rate_100k',
+                'vis4': 'by_canton', 'vis5': 'by_region', 'vis6': 'causes_men'}
+
+
+# --- Synthetic scaled data ---
+
+def _iso_weeks(year):
+    """Number of ISO weeks in year (52 or 53)."""
+    return datetime.date(year, 12, 28).isocalendar()[1]
+
+
+def _scale_years(df, year_col, scale, span):
+    """
+    Prepends scale - 1 copies of df shifted back by span years each. With a
+    'Week' column, rows for week 53 of years that only have 52 ISO weeks are
+    dropped, since such data can't exist.
+    """
+    copies = [df.assign(**{year_col: df[year_col] - span * k}) for k in range(scale - 1, 0, -1)]
+    scaled = pd.concat(copies + [df], ignore_index=True)
+    if 'Week' in scaled.columns:
+        weeks = scaled[year_col].map({y: _iso_weeks(int(y)) for y in scaled[year_col].unique()})
+        scaled = scaled[scaled['Week'] <= weeks].reset_index(drop=True)
+    return scaled
+
+
+def _scale_regions(df, scale):
+    """Adds scale - 1 copies of every sub-national region under new GEO codes."""
+    detail = df[df['GEO'].astype(str) != 'CH']
+    copies = [detail.assign(GEO=detail['GEO'].astype(str) + f"x{k}") for k in range(1, scale)]
+    return pd.concat([df.assign(GEO=df['GEO'].astype(str))] + copies, ignore_index=True)
+
+
+def write_scaled_files(directory, scale):
+    """
+    Writes scaled copies of the CSV datasets into directory, keeping each file's
+    dialect, and returns {dataset name: (full path, options)}. The Excel
+    workbooks are only benchmarked at scale 1.
+    """
+    files = {}
+    for name, spec in DATASETS.items():
+        source = os.path.join(DATA_DIR, spec['file'])
+        if not os.path.exists(source):
+            continue
+        if scale == 1 or not spec['file'].lower().endswith('.csv'):
+            if scale == 1:
+                files[name] = (source, spec['options'])
+            continue
+        df = read_source(source, **spec['options'])
+        target = os.path.join(directory, f"x{scale}_{spec['file']}")
+        if 'TIME_PERIOD' in df.columns:
+            _scale_regions(df, scale).to_csv(target, index=False)
+        elif 'Week' in df.columns:
+            span = int(df['Year'].max() - df['Year'].min() + 1)
+            _scale_years(df, 'Year', scale, span).to_csv(target, sep=';', index=False, na_rep='.')
+        else:
+            year_col = df.columns[0]
+            span = int(df[year_col].max() - df[year_col].min() + 1)
+            decimal = ',' if name == 'rate_100k' else '.'
+            _scale_years(df, year_col, scale, span).to_csv(target, index=False, decimal=decimal,
+                                                           encoding='utf-8-sig')
+        files[name] = (target, spec['options'])
+    return files
+
+
+# --- Measurement ---
+
+def measure(fn, repeat, setup=None):
+    """Median wall time over repeat runs and peak traced memory of one extra run."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': statistics.median(times), 'peak_bytes': peak}, result
+
+
+def run_cases(scale, files, repeat):
+    """Runs all cases for one scale and returns {case name: metrics}."""
+    results = {}
+
+    def record(case, fn, setup=None):
+        metrics, result = measure(fn, repeat, setup)
+        results[f"x{scale}/{case}"] = metrics
+        return result
+
+    frames = {}
+    for name, (path, options) in files.items():
+        record(f"load/{name}/parse", lambda: read_source(path, **options))
+        columnar_cache.load_columnar(path, **options)  # Fill the cache once
+        frames[name] = record(f"load/{name}/cached", lambda: columnar_cache.load_columnar(path, **options))
+
+    if 'weekly_deaths' in frames:
+        record("aggregate/weekly_totals", lambda: aggregates.weekly_totals(frames['weekly_deaths']),
+               setup=aggregates.clear_memo)
+    if 'by_region' in frames:
+        record("aggregate/region_cube", lambda: region_cube(frames['by_region']), setup=aggregates.clear_memo)
+        record("aggregate/region_index", lambda: region_index(frames['by_region']), setup=aggregates.clear_memo)
+        index = region_index(frames['by_region'])
+        record("aggregate/region_query", lambda: index.query(geo='CH04', age=['Y80T84', 'Y85T89'], sex='F'))
+        cube = region_cube(frames['by_region'])
+        record("aggregate/region_slice",
+               lambda: cube.slice(geo=cube.labels['geo'][:2], age=cube.labels['age'][-3:], sex=['F']))
+        record("aggregate/region_baseline", lambda: region_baseline(frames['by_region']),
+               setup=lambda: (aggregates.clear_memo(), region_cube(frames['by_region'])))
+
+    for view_id, name in FIGURE_VIEWS.items():
+        create_plot = load_view_function(view_id)
+        if create_plot is None or name not in frames:
+            continue
+        aggregates.clear_memo()
+        fig = record(f"figure/{view_id}/build", lambda: create_plot(frames[name]))
+        if fig is None:
+            continue
+        payload = record(f"figure/{view_id}/to_json", fig.to_json)
+        results[f"x{scale}/figure/{view_id}/to_json"]['payload_bytes'] = len(payload.encode())
+    return results
+
+
+def run(scales, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep synthetic files' cache entries out of data/.cache
+        columnar_cache.CACHE_DIR = os.path.join(tmp, 'cache')
+        for scale in scales:
+            print(f"Benchmarking scale x{scale}...", file=sys.stderr)
+            results.update(run_cases(scale, write_scaled_files(tmp, scale), repeat))
+    return results
+
+
+# --- Reporting ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _format_bytes(n):
+    return "-" if n is None else f"{n / 1024:,.0f} KiB"
+
+
+def print_table(results, baseline=None, threshold=DEFAULT_THRESHOLD):
+    """Prints one line per case; with a baseline, adds the time ratio and flags regressions."""
+    regressions = []
+    print(f"{'case':48} {'time':>10} {'peak mem':>12} {'payload':>12}" + ("  vs baseline" if baseline else ""))
+    for case, m in results.items():
+        line = (f"{case:48} {m['seconds'] * 1000:8.2f}ms {_format_bytes(m['peak_bytes']):>12} "
+                f"{_format_bytes(m.get('payload_bytes')):>12}")
+        base = (baseline or {}).get(case)
+        if base:
+            ratio = m['seconds'] / base['seconds'] if base['seconds'] else 1.0
+            grew = [key for key in ('seconds', 'peak_bytes', 'payload_bytes')
+                    if base.get(key) and m.get(key, 0) > base[key] * threshold]
+            line += f"  {ratio:5.2f}x" + (f"  REGRESSION ({', '.join(grew)})" if grew else "")
+            if grew:
+                regressions.append(case)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loaders, aggregations and figure builders.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--save', metavar='PATH', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a saved baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    regressions = print_table(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'commit': _git_commit(), 'python': platform.python_version(),
+                       'pandas': pd.__version__, 'repeat': args.repeat, 'results': results}, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
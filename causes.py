@@ -0,0 +1,106 @@
+# causes.py - Reader for the FSO cause-of-death workbooks (Männer / Frauen seit 1970)
+#
+# The workbooks are laid out for print: a title, a row of years (each spanning
+# an 'Anzahl' and a 'Rate' column), then one row per cause with 'davon:' lines
+# and indentation marking sub-causes, and footnotes at the end. This reader
+# streams the first sheet with openpyxl in read-only mode and returns a tidy,
+# typed long table; columnar_cache stores it, so later starts never open the
+# workbook again.
+
+import re
+
+import pandas as pd
+
+CAUSE_COLUMNS = ['Year', 'Sex', 'Cause', 'Level', 'Parent', 'Deaths', 'Rate']
+TOTAL_CAUSE = "Alle Todesursachen"
+SEX_BY_TITLE = {'Männer': 'M', 'Frauen': 'F'}
+MISSING_MARKERS = {'*', '...', '-', ''}  # '*' = cause not coded in that year
+
+_FOOTNOTE = re.compile(r'\s+\d\)$')
+
+
+def _clean_label(label):
+    """'Unfälle insgesamt 3)' -> 'Unfälle insgesamt', double spaces collapsed."""
+    label = _FOOTNOTE.sub('', str(label).strip())
+    return re.sub(r'\s+', ' ', label)
+
+
+def _number(value):
+    if value is None or (isinstance(value, str) and value.strip() in MISSING_MARKERS):
+        return None
+    return float(value)
+
+
+def _indent(cell):
+    alignment = getattr(cell, 'alignment', None)
+    return int(alignment.indent or 0) if alignment is not None else 0
+
+
+def read_causes_workbook(full_path, sex=None):
+    """
+    Parses a cause-of-death workbook into a long table with columns
+    Year, Sex ('M'/'F'), Cause, Level (0 = main cause), Parent (main cause of a
+    sub-cause), Deaths (Int64, <NA> where not coded) and Rate (age-standardised
+    per 100,000). sex is taken from the title ('Männer'/'Frauen') if not given.
+    """
+    import openpyxl  # Only needed when the cache has no copy yet
+
+    workbook = openpyxl.load_workbook(full_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        year_of_column, measure_of_column = {}, {}
+        parents = {}  # indent level -> label of the last cause seen at that level
+        records = []
+
+        for row in sheet.iter_rows():
+            values = [cell.value for cell in row]
+            label = values[0] if values else None
+
+            if sex is None and isinstance(label, str):
+                sex = next((code for word, code in SEX_BY_TITLE.items() if word in label), None)
+
+            # Header block: the row of years, then the row of units below it
+            if not year_of_column:
+                years = {i: v for i, v in enumerate(values) if isinstance(v, int) and 1900 <= v <= 2100}
+                if len(years) >= 2:
+                    year = None
+                    for i in range(1, len(values)):
+                        year = years.get(i, year)
+                        if year is not None:
+                            year_of_column[i] = year
+                continue
+            if not measure_of_column:
+                units = {i: str(v) for i, v in enumerate(values) if i in year_of_column and v is not None}
+                if any(u.startswith('Anzahl') for u in units.values()):
+                    measure_of_column = {i: ('Deaths' if u.startswith('Anzahl') else 'Rate')
+                                         for i, u in units.items() if u.startswith(('Anzahl', 'Rate'))}
+                continue
+
+            # Cause rows, up to the data-status line / footnotes
+            if not isinstance(label, str) or not label.strip() or label.strip() == 'davon:':
+                continue
+            if label.startswith('Stand der Daten'):
+                break
+            cells = {i: values[i] for i in measure_of_column if i < len(values)}
+            if all(v is None for v in cells.values()):
+                continue
+
+            cause, level = _clean_label(label), _indent(row[0])
+            parents[level] = cause
+            parent = parents.get(level - 1) if level > 0 else None
+            by_year = {}
+            for i, value in cells.items():
+                by_year.setdefault(year_of_column[i], {})[measure_of_column[i]] = _number(value)
+            for year, measures in by_year.items():
+                records.append((year, sex, cause, level, parent, measures.get('Deaths'), measures.get('Rate')))
+    finally:
+        workbook.close()
+
+    if not records:
+        raise ValueError(f"No cause-of-death rows found in {full_path}")
+    df = pd.DataFrame.from_records(records, columns=CAUSE_COLUMNS)
+    df['Year'] = df['Year'].astype('int32')
+    df['Level'] = df['Level'].astype('int8')
+    df['Deaths'] = df['Deaths'].round().astype('Int64')
+    df['Rate'] = df['Rate'].astype('float64')
+    return df
@@ -0,0 +1,220 @@
+# columnar_cache.py - Persistent on-disk Arrow cache for parsed data files
+#
+# load_data() in app.py is wrapped in st.cache_data, which only lives as long as
+# one server process. This module stores each parsed DataFrame as an
+# uncompressed Arrow IPC file in data/.cache/, keyed by the source file's
+# content hash plus the parse options, so restarts and new worker replicas can
+# memory-map the typed columns instead of re-parsing CSV/Excel.
+#
+# Build all caches ahead of time with:
+#     python columnar_cache.py compile
+# or let load_data() fill them lazily on first use.
+
+import hashlib
+import json
+import os
+import sys
+
+import pandas as pd
+
+import metrics
+from aggregates import set_data_version
+from datasets import DATASETS
+from loaders import DATA_DIR, read_source
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # Cache is simply disabled without pyarrow
+    pa = None
+
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+CACHE_FORMAT_VERSION = 3  # Bump when the stored layout/typing changes
+DEFAULT_OPTIONS = {'is_excel': False, 'specific_delimiter': None, 'decimal_separator': None,
+                   'filters': None, 'chunksize': None, 'loader': None, 'aggregate': None}
+
+# --- Keys and paths ---
+
+def file_digest(full_path):
+    """Returns the sha256 hex digest of a file's contents (raises FileNotFoundError)."""
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _normalize_options(options):
+    """Drops options left at read_source's defaults so equivalent calls share a key."""
+    return {k: v for k, v in options.items() if DEFAULT_OPTIONS.get(k, object()) != v}
+
+
+def cache_key(full_path, options, content_digest=None):
+    """
+    Key = source content hash + parse options + cache format version.
+    content_digest skips re-hashing the file when the caller already has its file_digest.
+    """
+    options = _normalize_options(options)
+    digest = hashlib.sha256()
+    digest.update((content_digest or file_digest(full_path)).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    digest.update(str(CACHE_FORMAT_VERSION).encode())
+    return digest.hexdigest()[:24]
+
+
+def cache_path(full_path, key):
+    base = os.path.splitext(os.path.basename(full_path))[0]
+    return os.path.join(CACHE_DIR, f"{base}-{key}.arrow")
+
+
+# --- Column typing ---
+
+def _looks_numeric(series):
+    return pd.to_numeric(series, errors='coerce').notna().any()
+
+
+def compact_dtypes(df):
+    """
+    Returns df with storage-friendly, Arrow-compatible column types:
+    - low-cardinality text columns (GEO, AGE, SEX, ...) become categoricals
+    - object columns mixing numbers and text (Excel '*' cells) are stored as text,
+      purely numeric object columns as numbers
+    Numeric-looking text columns such as 'NoDeaths_EP' are left alone so the
+    vis functions still see the values they expect.
+    Only converted columns are new; the others share memory with df.
+    """
+    df = df.copy(deep=False)  # Column assignments below don't touch the caller's frame
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue  # Already compact (e.g. from streaming.py)
+        if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        non_null = series.dropna()
+        if non_null.empty:
+            continue
+        is_text = non_null.map(lambda v: isinstance(v, str))
+        if not is_text.all():
+            if not is_text.any():
+                df[col] = pd.to_numeric(series, errors='coerce')
+            else:
+                df[col] = series.map(lambda v: v if pd.isna(v) else str(v)).astype(object)
+            continue
+        if non_null.nunique() <= len(non_null) // 2 and not _looks_numeric(non_null):
+            df[col] = series.astype('category')
+    return df
+
+
+# --- Read / write ---
+
+def read_table(path):
+    """Memory-maps an Arrow IPC file as a DataFrame whose numeric columns are read-only views."""
+    table = pa_ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def write_table(path, df):
+    """Writes df as an uncompressed Arrow IPC file, atomically (temp file + os.replace)."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa_ipc.new_file(tmp_path, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)  # Atomic, so concurrent workers never see half a file
+
+
+def read_cached(full_path, options, key=None):
+    """
+    Returns the cached DataFrame for (full_path, options), memory-mapped from
+    disk, or None if there is no cache entry yet (or pyarrow is missing).
+    key skips re-hashing the file when the caller already has its cache_key.
+    """
+    if pa is None:
+        return None
+    path = cache_path(full_path, key or cache_key(full_path, options))
+    if not os.path.exists(path):
+        return None
+    try:
+        return read_table(path)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(f"Ignoring unreadable cache file {path}: {e}")
+        return None
+
+
+def write_cached(full_path, options, df, key=None):
+    """
+    Stores df (after compact_dtypes) in the cache and returns the typed frame.
+    Cache write failures are reported but never stop the caller.
+    """
+    typed = compact_dtypes(df)
+    if pa is None:
+        return typed
+    path = cache_path(full_path, key or cache_key(full_path, options))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_table(path, typed)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Could not write cache file {path}: {e}")
+    return typed
+
+
+def load_columnar(full_path, **options):
+    """
+    Cache-first load: memory-map the cached columns or parse and fill the cache.
+    Numeric columns of the returned frame are read-only views of the mapped
+    file, so one frame can be shared by all sessions without defensive copies.
+    The cache key is recorded as the frame's data version so derived results
+    (see aggregates.py) can be memoized per version of the data.
+    """
+    key = cache_key(full_path, options)
+    metrics.count('cache_lookups', cache='columnar')
+    df = read_cached(full_path, options, key)
+    if df is None:
+        metrics.count('cache_misses', cache='columnar')
+        with metrics.stage('parse', file=os.path.basename(full_path)):
+            parsed = read_source(full_path, **options)
+        typed = write_cached(full_path, options, parsed, key)
+        # Re-open what was just written so a miss returns the same read-only,
+        # memory-mapped columns as a hit
+        df = read_cached(full_path, options, key)
+        if df is None:  # No pyarrow, or the cache write failed
+            df = typed
+    set_data_version(df, key)
+    return df
+
+
+# --- Command line ---
+
+def compile_all():
+    """Parses every known source once and stores it in the cache."""
+    for spec in DATASETS.values():
+        file_path, options = spec['file'], spec['options']
+        full_path = os.path.join(DATA_DIR, file_path)
+        if not os.path.exists(full_path):
+            print(f"skip     {file_path} (not found)")
+            continue
+        if read_cached(full_path, options) is not None:
+            print(f"cached   {file_path}")
+            continue
+        df = write_cached(full_path, options, read_source(full_path, **options))
+        print(f"compiled {file_path} ({len(df)} rows)")
+
+
+def clear_cache():
+    """Deletes all cache files."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.arrow') or name.endswith('.tmp'):
+            os.remove(os.path.join(CACHE_DIR, name))
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'compile'
+    if command == 'compile':
+        if pa is None:
+            sys.exit("pyarrow is required to build the columnar cache (pip install pyarrow)")
+        compile_all()
+    elif command == 'clear':
+        clear_cache()
+    else:
+        sys.exit(f"Usage: python {os.path.basename(__file__)} [compile|clear]")
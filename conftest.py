@@ -0,0 +1,7 @@
+# conftest.py - Lets a plain `pytest` run from the repository root import the
+# flat top-level modules (aggregates, columnar_cache, ...) from tests/.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
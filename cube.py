@@ -0,0 +1,158 @@
+# cube.py - Materialized [geo, age, sex, week] data cube for the weekly region data
+#
+# The region file (and the canton file vis4 will use, which has the same
+# TIME_PERIOD/GEO/AGE/SEX/OBS_VALUE layout) already ships totals ('CH' geo,
+# '_T' age, 'T' sex) next to the detail rows. DataCube puts every value into a
+# dense NumPy array once, so slices are plain array indexing, rollups are sums
+# over an axis, and the shipped totals can be checked against their details.
+
+import numpy as np
+import pandas as pd
+
+from aggregates import memoized
+from region_query import TOTAL_AGE, TOTAL_GEO, TOTAL_SEX, region_index
+
+AXES = ('geo', 'age', 'sex', 'time')
+TOTAL_LABELS = {'geo': TOTAL_GEO, 'age': TOTAL_AGE, 'sex': TOTAL_SEX}
+
+
+def nan_sum(array, axis):
+    """Sum over axis that stays NaN where every summed cell is missing."""
+    total = np.nansum(array, axis=axis)
+    return np.where(np.isnan(array).all(axis=axis), np.nan, total)
+
+
+class DataCube:
+    """Dense weekly deaths array indexed by [geo, age, sex, time] with label lookups."""
+
+    def __init__(self, values, labels, years, weeks):
+        self.values = values  # float64, NaN where the file has no row
+        self.labels = labels  # axis name -> list of codes, in array order
+        self.years, self.weeks = years, weeks
+        self.time_labels = np.array([f"{y}-W{w:02d}" for y, w in zip(years, weeks)], dtype=object)
+        self._positions = {axis: {label: i for i, label in enumerate(labels[axis])} for axis in AXES[:3]}
+
+    @classmethod
+    def from_index(cls, index):
+        """Scatters the rows of a RegionIndex into a dense array."""
+        values = np.full(index.shape, np.nan)
+        values[index.geo, index.age, index.sex, index.time] = index.values
+        labels = {'geo': list(index.geo_labels), 'age': list(index.age_labels), 'sex': list(index.sex_labels)}
+        return cls(values, labels, index.years, index.weeks)
+
+    def updated(self, delta):
+        """
+        New cube with the non-missing cells of delta (a cube of appended or
+        revised rows) written over this one. Codes and weeks that only occur in
+        delta are added; this cube is not modified.
+        """
+        labels = {axis: self.labels[axis] + [label for label in delta.labels[axis]
+                                             if label not in self._positions[axis]]
+                  for axis in AXES[:3]}
+        year_week = np.union1d(self.years * 100 + self.weeks, delta.years * 100 + delta.weeks)
+        values = np.full((len(labels['geo']), len(labels['age']), len(labels['sex']), len(year_week)), np.nan)
+        lookup = {axis: {label: i for i, label in enumerate(labels[axis])} for axis in AXES[:3]}
+        for cube in (self, delta):
+            cells = np.ix_(*[[lookup[axis][label] for label in cube.labels[axis]] for axis in AXES[:3]],
+                           np.searchsorted(year_week, cube.years * 100 + cube.weeks))
+            values[cells] = np.where(np.isnan(cube.values), values[cells], cube.values)
+        return DataCube(values, labels, year_week // 100, year_week % 100)
+
+    def to_frame(self):
+        """
+        The cells that have a value as a long frame (TIME_PERIOD, GEO, AGE, SEX,
+        OBS_VALUE) in chronological order, with categorical codes; region_cube()
+        of it is this cube. OBS_VALUE is integer if every value is.
+        """
+        time, geo, age, sex = np.nonzero(~np.isnan(np.moveaxis(self.values, 3, 0)))
+        values = self.values[geo, age, sex, time]
+        if np.array_equal(values, np.round(values)):
+            values = values.astype(np.int64)
+        return pd.DataFrame({
+            'TIME_PERIOD': pd.Categorical.from_codes(time, list(self.time_labels)),
+            'GEO': pd.Categorical.from_codes(geo, self.labels['geo']),
+            'AGE': pd.Categorical.from_codes(age, self.labels['age']),
+            'SEX': pd.Categorical.from_codes(sex, self.labels['sex']),
+            'OBS_VALUE': values,
+        })
+
+    # --- Lookups ---
+
+    def positions(self, axis, selected=None):
+        """Array positions of the selected codes on an axis (None = all codes)."""
+        if selected is None:
+            return list(range(len(self.labels[axis])))
+        if isinstance(selected, str):
+            selected = [selected]
+        unknown = [s for s in selected if s not in self._positions[axis]]
+        if unknown:
+            raise KeyError(f"Unknown {axis} codes {unknown}; known: {self.labels[axis]}")
+        return [self._positions[axis][s] for s in selected]
+
+    def time_range(self, years=None):
+        """Slice of time slots covering the inclusive (first, last) year range."""
+        if years is None:
+            return slice(0, len(self.years))
+        year_week = self.years * 100 + self.weeks
+        first = int(np.searchsorted(year_week, years[0] * 100, side='left'))
+        last = int(np.searchsorted(year_week, years[1] * 100 + 99, side='right'))
+        return slice(first, last)
+
+    def detail_positions(self, axis):
+        """Positions of the detail codes on an axis, i.e. everything but the shipped total."""
+        total = TOTAL_LABELS.get(axis)
+        return [i for i, label in enumerate(self.labels[axis]) if label != total]
+
+    # --- Slicing and rollups ---
+
+    def slice(self, geo=None, age=None, sex=None, years=None):
+        """Sub-array [geo, age, sex, time] for the selected codes and year range."""
+        times = self.time_range(years)
+        return self.values[np.ix_(self.positions('geo', geo), self.positions('age', age),
+                                  self.positions('sex', sex), np.arange(len(self.years))[times])]
+
+    def rollup(self, axis):
+        """
+        Sums the detail codes of an axis (e.g. all age groups without '_T'),
+        keeping the axis with length 1 so the result lines up with the cube.
+        """
+        i = AXES.index(axis)
+        details = np.take(self.values, self.detail_positions(axis), axis=i)
+        return np.expand_dims(nan_sum(details, axis=i), i)
+
+    def check_totals(self, tolerance=0):
+        """
+        Compares every shipped total ('CH', '_T', 'T') with the sum of its detail
+        rows. Returns a DataFrame of the mismatches beyond tolerance (empty if the
+        file is consistent), with the axis checked and the cell labels.
+        """
+        problems = []
+        for axis, total_label in TOTAL_LABELS.items():
+            if total_label not in self._positions[axis]:
+                continue
+            i = AXES.index(axis)
+            shipped = np.take(self.values, [self._positions[axis][total_label]], axis=i)
+            diff = shipped - self.rollup(axis)
+            bad = np.argwhere(np.abs(diff) > tolerance)  # NaN compares False, so missing cells are skipped
+            for cell in bad:
+                g, a, s, t = cell
+                problems.append({
+                    'axis': axis,
+                    'GEO': self.labels['geo'][g] if axis != 'geo' else total_label,
+                    'AGE': self.labels['age'][a] if axis != 'age' else total_label,
+                    'SEX': self.labels['sex'][s] if axis != 'sex' else total_label,
+                    'Year-Week': self.time_labels[t],
+                    'total': shipped[tuple(cell)],
+                    'detail_sum': shipped[tuple(cell)] - diff[tuple(cell)],
+                })
+        return pd.DataFrame(problems, columns=['axis', 'GEO', 'AGE', 'SEX', 'Year-Week', 'total', 'detail_sum'])
+
+
+def region_cube(dataframe):
+    """DataCube for the region (or canton) frame, built once per data version."""
+    return memoized('region_cube', dataframe, lambda df: DataCube.from_index(region_index(df)))
+
+
+def region_totals_check(dataframe):
+    """region_cube(dataframe).check_totals(), computed once per data version."""
+    return memoized('region_totals_check', dataframe, lambda df: region_cube(df).check_totals())
@@ -0,0 +1,81 @@
+# datasets.py - Registry of data files, how to load them, and which views use them
+#
+# app.py loads the datasets the active view needs first, and only imports the
+# visN.py module of that view, so the default "Weekly Deaths" page never waits
+# for openpyxl or the large region file; those are prefetched in the background.
+
+import importlib
+
+# Dataset name -> loader spec (file in data/ and load_data options) -> views using it.
+# CSV delimiters/decimal marks are detected by dialect.py; options only override them.
+# For full FSO extracts add e.g. 'filters': {'years': (2015, 2025), 'GEO': [...]} and
+# 'chunksize': 200_000 to stream the file and keep only the rows a view needs.
+# 'aggregate' names the only aggregate the views read; a streamed file (larger than
+# streaming.STREAMING_THRESHOLD_BYTES) is folded into it instead of being kept as rows.
+DATASETS = {
+    'weekly_deaths': {
+        'file': 'Weekly_number_of_deaths.csv',
+        'options': {'aggregate': 'weekly_totals'},
+        'views': ['vis1'],
+    },
+    'absolute_deaths': {
+        'file': 'Deaths_Absolute_number.csv',
+        'options': {},
+        'views': ['vis2'],
+    },
+    'rate_100k': {
+        'file': 'Mortality_rate_per_100000_inhabitants.csv',
+        'options': {},
+        'views': ['vis3'],
+    },
+    'by_canton': {
+        'file': 'Deaths_per_week_by_5-year_age_group_sex_and_canton.csv',
+        'options': {},
+        'views': ['vis4'],
+    },
+    'by_region': {
+        'file': 'Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv',
+        'options': {'aggregate': 'region_cube'},
+        'views': ['vis5'],
+    },
+    # Tidy long tables (Year, Sex, Cause, Level, Parent, Deaths, Rate), see causes.py
+    'causes_men': {
+        'file': 'Sterbefälle_und_Sterbeziffern_wichtiger_Todesursachen_Männer_seit_1970.xlsx',
+        'options': {'loader': 'causes'},
+        'views': ['vis6'],
+    },
+    # Not shown yet, kept here so the cache compiler knows about it
+    'causes_women': {
+        'file': 'Sterbefälle_und_Sterbeziffern_wichtiger_Todesursachen_Frauen_seit_1970.xlsx',
+        'options': {'loader': 'causes'},
+        'views': [],
+    },
+}
+
+# View id -> sidebar label and the plot function implementing it
+VIEWS = {
+    'vis1': {'label': "Weekly Deaths", 'module': 'vis1', 'function': 'create_weekly_deaths_plot'},
+    'vis2': {'label': "Absolute Deaths", 'module': 'vis2', 'function': 'create_absolute_deaths_plot'},
+    'vis3': {'label': "Mortality Rate / 100k", 'module': 'vis3', 'function': 'create_mortality_rate_plot'},
+    'vis4': {'label': "Deaths by Canton", 'module': 'vis4', 'function': 'create_canton_plot'},
+    'vis5': {'label': "Deaths by Major Region", 'module': 'vis5', 'function': 'create_region_plot'},
+    'vis6': {'label': "Causes of Death (Men)", 'module': 'vis6', 'function': 'create_causes_men_plot'},
+}
+
+
+def datasets_for_view(view_id):
+    """Returns the names of the datasets a view needs, in registry order."""
+    return [name for name, spec in DATASETS.items() if view_id in spec['views']]
+
+
+def load_view_function(view_id):
+    """
+    Imports the view's visN module on first use and returns its plot function,
+    or None if the module or function is missing/has errors.
+    """
+    view = VIEWS[view_id]
+    try:
+        module = importlib.import_module(view['module'])
+        return getattr(module, view['function'])
+    except (ImportError, AttributeError):
+        return None
@@ -0,0 +1,150 @@
+# dialect.py - One-pass CSV dialect detection for the files in data/
+#
+# The exports in data/ differ in delimiter (';' vs ','), decimal mark ('1232,0'),
+# BOM, trailing '#' legend lines and blank-padded '.' placeholders for missing
+# values. sniff_csv() looks at a small sample from the head and tail of a file
+# and returns read_csv keyword arguments (including explicit column dtypes), so
+# each file is parsed once, already typed, with the C engine.
+
+import csv
+import io
+import re
+
+import pandas as pd
+
+SAMPLE_BYTES = 64 * 1024  # Read from the head, and a quarter of that from the tail
+CANDIDATE_DELIMITERS = [';', ',', '\t', '|']
+NA_TOKENS = {'', '.', '..', '...', '-', 'NA', 'N/A', 'n/a', 'NaN', 'nan', 'null'}
+
+_INT = re.compile(r'^[+-]?\d+$')
+_FLOAT_DOT = re.compile(r'^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$')
+_FLOAT_COMMA = re.compile(r'^[+-]?\d+,\d+$')
+
+
+def _read_sample(full_path):
+    """Returns (has_bom, head_lines, tail_lines) decoded from the start and end of the file."""
+    with open(full_path, 'rb') as f:
+        head = f.read(SAMPLE_BYTES)
+        f.seek(0, io.SEEK_END)
+        size = f.tell()
+        tail_start = max(len(head), size - SAMPLE_BYTES // 4)
+        f.seek(tail_start)
+        tail = f.read()
+    has_bom = head.startswith(b'\xef\xbb\xbf')
+    if has_bom:
+        head = head[3:]
+    head_lines = head.decode('utf-8', errors='replace').splitlines()
+    if len(head) == SAMPLE_BYTES - (3 if has_bom else 0) and head_lines:
+        head_lines = head_lines[:-1]  # Last line may be cut off
+    tail_lines = tail.decode('utf-8', errors='replace').splitlines()
+    if tail_start > len(head) and tail_lines:
+        tail_lines = tail_lines[1:]  # First line may be cut off
+    return has_bom, head_lines, tail_lines
+
+
+def _comment_prefix(lines):
+    """'#' if some lines start with it and no other line contains it, else None."""
+    starts = [line for line in lines if line.startswith('#')]
+    others = [line for line in lines if line.strip() and not line.startswith('#')]
+    if starts and not any('#' in line for line in others):
+        return '#'
+    return None
+
+
+def _detect_delimiter(lines):
+    """The candidate that splits every sample line into the same (largest) number of fields."""
+    best, best_fields = None, 1
+    for delimiter in CANDIDATE_DELIMITERS:
+        counts = {len(row) for row in csv.reader(lines, delimiter=delimiter)}
+        if len(counts) == 1:
+            fields = counts.pop()
+            if fields > best_fields:
+                best, best_fields = delimiter, fields
+    return best
+
+
+def _column_kind(values, decimal):
+    """'int', 'float' or None (text/unknown) for the non-missing sample values of a column."""
+    if not values:
+        return None
+    if all(_INT.match(v) for v in values):
+        return 'int'
+    pattern = _FLOAT_COMMA if decimal == ',' else _FLOAT_DOT
+    if all(_INT.match(v) or pattern.match(v) for v in values):
+        return 'float'
+    return None
+
+
+def sniff_csv(full_path):
+    """
+    Infers the dialect of a CSV file from a head/tail sample.
+    Returns a dict of pd.read_csv keyword arguments: sep, decimal, encoding,
+    comment, na_values (per column: every NA token for numeric columns, the
+    tokens seen in the sample for the others), skipinitialspace and dtype
+    (only for the columns whose sample values are all integers or all decimals).
+    """
+    has_bom, head_lines, tail_lines = _read_sample(full_path)
+    comment = _comment_prefix(head_lines + tail_lines)
+    data_lines = [line for line in head_lines + tail_lines
+                  if line.strip() and not (comment and line.startswith(comment))]
+    if not data_lines:
+        raise ValueError(f"No data lines found in {full_path}")
+
+    delimiter = _detect_delimiter(data_lines) or ','
+    rows = list(csv.reader(data_lines, delimiter=delimiter))
+    header, records = rows[0], rows[1:]
+    # A header line from the head sample may repeat at the start of the tail sample
+    records = [r for r in records if r != header]
+
+    raw_values = [v for r in records for v in r]
+    skipinitialspace = any(v[:1] == ' ' and v.strip() for v in raw_values)
+    columns = {name: [r[i].strip() for r in records if i < len(r)] for i, name in enumerate(header)}
+
+    seen_na = sorted({v for values in columns.values() for v in values if v in NA_TOKENS and v})
+    decimal = '.'
+    if any(_FLOAT_COMMA.match(v) for values in columns.values() for v in values):
+        # '1232,0' can only be a number if ',' is not the delimiter or the value was quoted
+        decimal = ','
+
+    dtype = {}
+    for name, values in columns.items():
+        present = [v for v in values if v not in NA_TOKENS]
+        kind = _column_kind(present, decimal)
+        if kind == 'int' and len(present) == len(values):
+            dtype[name] = 'int64'
+        elif kind in ('int', 'float'):
+            dtype[name] = 'float64'  # Integers with missing values are stored as floats
+    # Numeric columns accept every NA token, also ones that first appear after
+    # the sample, so a retry without dtypes still parses them as numbers
+    na_values = {name: sorted(NA_TOKENS - {''}) if name in dtype else seen_na for name in header}
+
+    # read_csv sees the header with the BOM removed when encoding is utf-8-sig
+    return {
+        'sep': delimiter,
+        'decimal': decimal,
+        'encoding': 'utf-8-sig' if has_bom else 'utf-8',
+        'comment': comment,
+        'na_values': na_values,
+        'skipinitialspace': skipinitialspace,
+        'dtype': dtype,
+    }
+
+
+def read_csv_sniffed(full_path, specific_delimiter=None, decimal_separator=None):
+    """
+    Parses a CSV file once with the sniffed dialect and explicit dtypes.
+    specific_delimiter/decimal_separator override the detected values.
+    If a column turns out not to match its sampled dtype, the file is parsed
+    again with pandas' own type inference for that case.
+    """
+    kwargs = sniff_csv(full_path)
+    if specific_delimiter:
+        kwargs['sep'] = specific_delimiter
+    if decimal_separator:
+        kwargs['decimal'] = decimal_separator
+    try:
+        return pd.read_csv(full_path, engine='c', **kwargs)
+    except (ValueError, TypeError) as e:
+        print(f"Sampled dtypes did not fit {full_path} ({e}), letting pandas infer them...")
+        kwargs.pop('dtype')
+        return pd.read_csv(full_path, engine='c', **kwargs)
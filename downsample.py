@@ -0,0 +1,60 @@
+# downsample.py - Shared server-side downsampling for long time series
+#
+# Plotting every week of every series ships tens of thousands of points to the
+# browser. Largest-Triangle-Three-Buckets (LTTB) keeps a fixed number of points
+# while preserving the visual shape, including single-week peaks such as the
+# 2020 excess-mortality spikes. Callers slice to the visible range first
+# (e.g. the year slider in app.py) so a narrow range is shown at full resolution.
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_POINTS = 400  # Target points per series
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Returns the sorted positions of the n_out points LTTB keeps from (x, y).
+    x must be increasing; all points are kept if n_out >= len(x).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Pick the point forming the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(frame, y, max_points=DEFAULT_MAX_POINTS, x=None):
+    """
+    Returns the rows of frame that LTTB keeps for column y (at most max_points).
+    x names an increasing numeric column; by default rows are taken as equally
+    spaced. Rows with a missing y are dropped.
+    """
+    frame = frame[frame[y].notna()]
+    if max_points is None or len(frame) <= max_points:
+        return frame
+    x_values = frame[x].to_numpy() if x else np.arange(len(frame))
+    return frame.iloc[lttb_indices(x_values, frame[y].to_numpy(), max_points)]
+
+
+def downsample_groups(frame, y, by, max_points=DEFAULT_MAX_POINTS, x=None):
+    """Applies downsample() to each group of `by` separately (one series per group)."""
+    parts = [downsample(group, y, max_points, x) for _, group in frame.groupby(by, sort=False, observed=True)]
+    return pd.concat(parts) if parts else frame.iloc[0:0]
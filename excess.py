@@ -0,0 +1,131 @@
+# excess.py - Vectorized expected-deaths baselines and 99% bands (Serfling regression)
+#
+# For every weekly series a Serfling-style model
+#     deaths ~ a + b * t + c * sin(2 pi t / year) + d * cos(2 pi t / year)
+# is fitted by least squares, with t the time in years. All series of a
+# [geo, age, sex, time] block are fitted at once: the weighted normal equations
+# of every series are stacked with einsum and solved in one batched
+# np.linalg.solve, so missing weeks (NaN) are simply left out of each series'
+# own fit. The band is expected +/- 2.576 residual standard deviations (99%).
+#
+# The region file only covers 2024-W01 onwards, too short for a per-ISO-week
+# multi-year average; the regression works with any length and, with longer
+# extracts, baseline_years restricts the fit to reference years (e.g. 2015-2019).
+
+import datetime
+
+import numpy as np
+
+from aggregates import memoized
+from cube import AXES, nan_sum, region_cube
+
+Z_99 = 2.576  # Two-sided 99% normal quantile
+DAYS_PER_YEAR = 365.25
+MIN_FIT_WEEKS = 8  # Series with fewer observed weeks get no baseline (NaN)
+
+
+class Baseline:
+    """Expected deaths and 99% band for a block of weekly series (time is the last axis)."""
+
+    def __init__(self, observed, expected, sigma):
+        self.observed = observed
+        self.expected = expected
+        self.lower = np.maximum(expected - Z_99 * sigma[..., None], 0)
+        self.upper = expected + Z_99 * sigma[..., None]
+
+    @property
+    def excess(self):
+        """Observed minus expected deaths (NaN where either is missing)."""
+        return self.observed - self.expected
+
+    @property
+    def above(self):
+        """True for the weeks whose observed deaths exceed the upper band."""
+        with np.errstate(invalid='ignore'):
+            return self.observed > self.upper
+
+    def take(self, index):
+        """The Baseline of a sub-block, e.g. baseline.take(np.ix_(geos, ages, sexes, times))."""
+        part = Baseline.__new__(Baseline)
+        part.observed, part.expected = self.observed[index], self.expected[index]
+        part.lower, part.upper = self.lower[index], self.upper[index]
+        return part
+
+
+def design_matrix(years, weeks):
+    """Serfling regressors [1, t, sin, cos] per ISO week, t in years since the first week."""
+    days = np.array([datetime.date.fromisocalendar(int(y), int(w), 1).toordinal()
+                     for y, w in zip(years, weeks)], dtype=float)
+    t = (days - days[0]) / DAYS_PER_YEAR if len(days) else days
+    angle = 2 * np.pi * t
+    return np.column_stack([np.ones_like(t), t, np.sin(angle), np.cos(angle)])
+
+
+def fit_baseline(values, years, weeks, fit_mask=None):
+    """
+    Fits the Serfling model to every series of values (any leading shape, time
+    last) in one batched solve. fit_mask (bool per week) limits the weeks the
+    model is fitted on; expected values are predicted for all weeks.
+    """
+    X = design_matrix(years, weeks)  # [time, k]
+    n_time, k = X.shape
+    series = values.reshape(-1, n_time)  # [series, time]
+    weight = ~np.isnan(series)
+    if fit_mask is not None:
+        weight &= np.asarray(fit_mask, dtype=bool)[None, :]
+    y = np.where(weight, series, 0.0)
+    w = weight.astype(float)
+
+    # Normal equations per series: (X' W X) beta = X' W y
+    xtwx = np.einsum('ti,st,tj->sij', X, w, X)
+    xtwy = np.einsum('ti,st->si', X, w * y)
+    n_fit = w.sum(axis=1)
+    fittable = n_fit >= max(MIN_FIT_WEEKS, k + 1)
+    xtwx[~fittable] = np.eye(k)  # Keep the batch solvable; these series are blanked below
+    beta = np.linalg.solve(xtwx, xtwy[..., None])[..., 0]  # [series, k]
+
+    expected = beta @ X.T  # [series, time]
+    residual = np.where(weight, series - expected, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = np.sqrt((residual ** 2).sum(axis=1) / (n_fit - k))
+    expected[~fittable] = np.nan
+    sigma[~fittable] = np.nan
+
+    shape = values.shape
+    return Baseline(values, expected.reshape(shape), sigma.reshape(shape[:-1]))
+
+
+def _fit_mask(cube, baseline_years):
+    if baseline_years is None:
+        return None
+    mask = np.zeros(len(cube.years), dtype=bool)
+    mask[cube.time_range(baseline_years)] = True
+    return mask
+
+
+def region_baseline(dataframe, baseline_years=None):
+    """Baseline of every [geo, age, sex] cell of the region cube, computed once per data version."""
+    name = 'region_baseline' if baseline_years is None else f"region_baseline:{baseline_years[0]}-{baseline_years[1]}"
+    return memoized(name, dataframe, lambda df: _cube_baseline(region_cube(df), baseline_years))
+
+
+def _cube_baseline(cube, baseline_years):
+    return fit_baseline(cube.values, cube.years, cube.weeks, _fit_mask(cube, baseline_years))
+
+
+def slice_baseline(dataframe, geo, age, sex, years=None, baseline_years=None):
+    """
+    Baseline of the weekly series [geo, sex, time] obtained by summing the
+    selected age groups, restricted to the years shown. A single age group is
+    read from the cached region_baseline; a sum of several is fitted as its
+    own series (the band of a sum is not the sum of the bands).
+    """
+    cube = region_cube(dataframe)
+    times = np.arange(len(cube.years))[cube.time_range(years)]
+    positions = [cube.positions(axis, selected) for axis, selected in zip(AXES[:3], (geo, age, sex))]
+    if len(positions[1]) == 1:
+        block = region_baseline(dataframe, baseline_years).take(np.ix_(*positions, times))
+        return block.take((slice(None), 0))
+    totals = nan_sum(cube.values[np.ix_(*positions, np.arange(len(cube.years)))], axis=1)  # [geo, sex, time]
+    fitted = fit_baseline(totals, cube.years, cube.weeks, _fit_mask(cube, baseline_years))
+    return fitted.take((Ellipsis, times))
@@ -0,0 +1,238 @@
+# export_figures.py - Headless batch export of every figure to HTML/JSON/PNG
+#
+# Builds each view with its create_*_plot function (no Streamlit involved) plus
+# variants of the weekly plots: the weekly deaths plot (vis1) with the expected
+# range and per age group (the file has no region or sex columns), and the
+# weekly region plot (vis5) per region, age group and sex, in a process pool.
+# Every figure is keyed by a content hash of its data version, its arguments
+# and the plotting code; figures whose hash is already in the output
+# directory's manifest, with all requested formats written, are not rebuilt.
+#
+#     python export_figures.py                         # exports/ as HTML + JSON
+#     python export_figures.py --formats html png --jobs 4 --out site/figures
+#     python export_figures.py --views vis1 vis5 --no-variants --force
+#
+# PNG export needs kaleido (pip install kaleido); without it PNGs are skipped.
+
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from columnar_cache import cache_key, load_columnar
+from cube import TOTAL_LABELS, region_cube
+from datasets import DATASETS, VIEWS, datasets_for_view, load_view_function
+from loaders import DATA_DIR
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+DEFAULT_FORMATS = ['html', 'json']
+FORMATS = ['html', 'json', 'png']
+MANIFEST_NAME = 'manifest.json'
+# Modules besides visN.py whose code shapes a figure (see code_version)
+FIGURE_MODULES = ['aggregates', 'cube', 'downsample', 'excess', 'region_query', 'causes', 'dialect',
+                  'loaders', 'streaming']
+
+
+# --- Jobs ---
+
+def code_version():
+    """
+    Hash of the modules a figure is built from (the vis modules and the parsing
+    and aggregation code they use), so changes to them invalidate exported
+    figures and edits elsewhere (app.py, benchmarks.py, ...) don't.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    paths = sorted(glob.glob(os.path.join(here, 'vis*.py'))) + [os.path.join(here, f"{m}.py") for m in FIGURE_MODULES]
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _job(figure_id, view_id, dataset, **kwargs):
+    return {'id': figure_id, 'view': view_id, 'dataset': dataset, 'kwargs': kwargs}
+
+
+def _region_variants(dataset):
+    """One vis5 job per region, age group and sex, the other two axes at their totals."""
+    spec = DATASETS[dataset]
+    cube = region_cube(load_columnar(os.path.join(DATA_DIR, spec['file']), **spec['options']))
+    jobs = []
+    for axis, kwarg in (('geo', 'geo'), ('age', 'age'), ('sex', 'sex')):
+        for label in cube.labels[axis]:
+            if label != TOTAL_LABELS[axis]:
+                jobs.append(_job(f"vis5-{axis}-{label}", 'vis5', dataset, **{kwarg: [label]}))
+    return jobs
+
+
+def _weekly_variants(dataset):
+    """One vis1 job per age group of the weekly deaths file."""
+    spec = DATASETS[dataset]
+    frame = load_columnar(os.path.join(DATA_DIR, spec['file']), **spec['options'])
+    if 'Age' not in frame.columns:
+        return []
+    ages = sorted(set(frame['Age'].astype(str).str.strip()))
+    return [_job(f"vis1-age-{age}", 'vis1', dataset, age=[age]) for age in ages]
+
+
+def plan_jobs(views, variants=True):
+    """Returns the figure jobs for views whose data file exists."""
+    jobs = []
+    for view_id in views:
+        datasets = [name for name in datasets_for_view(view_id)
+                    if os.path.exists(os.path.join(DATA_DIR, DATASETS[name]['file']))]
+        if not datasets:
+            print(f"skip     {view_id} (data file not found)")
+            continue
+        dataset = datasets[0]
+        jobs.append(_job(view_id, view_id, dataset))
+        if variants and view_id == 'vis1':
+            jobs.append(_job('vis1-expected', view_id, dataset, show_expected=True))
+            jobs.extend(_weekly_variants(dataset))
+        if variants and view_id == 'vis5':
+            jobs.extend(_region_variants(dataset))
+    return jobs
+
+
+def data_versions(jobs):
+    """Cache key (content hash) of every dataset the jobs use, each file hashed once."""
+    versions = {}
+    for name in {job['dataset'] for job in jobs}:
+        spec = DATASETS[name]
+        versions[name] = cache_key(os.path.join(DATA_DIR, spec['file']), spec['options'])
+    return versions
+
+
+def job_hash(job, code, data):
+    """Content hash of a figure: data version (cache_key of its dataset) + view + arguments + code version."""
+    payload = json.dumps([data, job['view'], job['kwargs'], code], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+# --- Worker ---
+
+_frames = {}  # Per worker process: dataset name -> memory-mapped frame
+
+
+def _dataset(name):
+    if name not in _frames:
+        spec = DATASETS[name]
+        _frames[name] = load_columnar(os.path.join(DATA_DIR, spec['file']), **spec['options'])
+    return _frames[name]
+
+
+def build_figure(job, out_dir, formats):
+    """Builds one figure and writes it in the requested formats; returns (written files, error)."""
+    create_plot = load_view_function(job['view'])
+    if create_plot is None:
+        return [], f"{VIEWS[job['view']]['module']}.py could not be imported"
+    fig = create_plot(_dataset(job['dataset']), **job['kwargs'])
+    if fig is None:
+        return [], "plot function returned no figure"
+
+    files = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{job['id']}.{fmt}")
+        if fmt == 'html':
+            fig.write_html(path, include_plotlyjs='cdn')
+        elif fmt == 'json':
+            with open(path, 'w') as f:
+                f.write(fig.to_json())
+        elif fmt == 'png':
+            try:
+                fig.write_image(path)
+            except (ImportError, ValueError, RuntimeError) as e:  # kaleido/Chrome unusable
+                print(f"Skipping {path}: {e}")
+                continue
+        files.append(os.path.basename(path))
+    return files, None
+
+
+# --- Manifest ---
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_current(entry, digest, formats, out_dir):
+    """True if the manifest entry has this hash, covered these formats and its files still exist."""
+    if not entry or entry.get('hash') != digest or not set(formats) <= set(entry['formats']):
+        return False
+    return all(os.path.exists(os.path.join(out_dir, name)) for name in entry['files'])
+
+
+def export(views, out_dir=DEFAULT_OUT_DIR, formats=DEFAULT_FORMATS, jobs=None, variants=True, force=False):
+    """Exports all figures of views and returns the number of failed figures."""
+    if 'png' in formats and importlib.util.find_spec('kaleido') is None:
+        print("Skipping PNG export: kaleido is not installed (pip install kaleido)")
+        formats = [fmt for fmt in formats if fmt != 'png']
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = read_manifest(out_dir)
+    code = code_version()
+
+    planned = plan_jobs(views, variants)
+    versions = data_versions(planned)
+    pending = []
+    for job in planned:
+        digest = job_hash(job, code, versions[job['dataset']])
+        if not force and is_current(manifest.get(job['id']), digest, formats, out_dir):
+            print(f"current  {job['id']}")
+            continue
+        pending.append((job, digest))
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_figure, job, out_dir, formats): (job, digest) for job, digest in pending}
+        for future in as_completed(futures):
+            job, digest = futures[future]
+            try:
+                files, error = future.result()
+            except Exception as e:
+                files, error = [], str(e)
+            if error:
+                failures += 1
+                print(f"failed   {job['id']}: {error}")
+                manifest.pop(job['id'], None)
+                continue
+            print(f"exported {job['id']} ({', '.join(files)})")
+            # Only the formats actually written, so a skipped PNG is retried next time
+            written = [fmt for fmt in formats if f"{job['id']}.{fmt}" in files]
+            manifest[job['id']] = {'id': job['id'], 'hash': digest, 'view': job['view'],
+                                   'kwargs': job['kwargs'], 'formats': written, 'files': files}
+    write_manifest(out_dir, manifest)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export every visualization as static files.")
+    parser.add_argument('--views', nargs='+', choices=list(VIEWS), default=list(VIEWS))
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=DEFAULT_FORMATS)
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR, help="output directory (default: exports/)")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--no-variants', action='store_true', help="skip the per-region/age/sex variants")
+    parser.add_argument('--force', action='store_true', help="rebuild figures even if they are current")
+    args = parser.parse_args(argv)
+    failures = export(args.views, args.out, args.formats, args.jobs, not args.no_variants, args.force)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
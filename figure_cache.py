@@ -0,0 +1,85 @@
+# figure_cache.py - Process-wide LRU cache of serialized Plotly figures
+#
+# Most visitors look at the same few views with the same filters. FigureCache
+# keeps the JSON of every figure built, keyed by (view id, filter parameters,
+# data version of the input frames), so a repeat request skips the
+# create_*_plot function entirely. Entries are evicted least recently used
+# first once the stored JSON exceeds the byte cap. app.py shares one instance
+# between all sessions through st.cache_resource.
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+
+import metrics
+from aggregates import data_version
+
+DEFAULT_MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MB', '64')) * 1024 * 1024
+
+
+def figure_key(view_id, params, *frames):
+    """Cache key: view id, canonical JSON of the filter parameters and the data versions."""
+    return (view_id, json.dumps(params, sort_keys=True, default=str),
+            tuple(data_version(df) for df in frames))
+
+
+class FigureCache:
+    """Thread-safe LRU mapping of figure keys to figure JSON, capped at max_bytes of JSON."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # Guards the LRU order of _entries and the byte count
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The figure JSON stored under key, or None."""
+        with self._lock:
+            figure_json = self._entries.get(key)
+            if figure_json is not None:
+                self._entries.move_to_end(key)
+            return figure_json
+
+    def put(self, key, figure_json):
+        """Stores figure_json, evicting the least recently used entries beyond the cap."""
+        size = len(figure_json)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = figure_json
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                metrics.count('cache_evictions', cache='figure')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def figure(self, view_id, params, frames, build):
+        """
+        Returns the figure for (view_id, params, frames): rebuilt from cached JSON
+        on a hit, else build() (cached unless it returns None).
+        """
+        key = figure_key(view_id, params, *frames)
+        metrics.count('cache_lookups', cache='figure')
+        figure_json = self.get(key)
+        if figure_json is not None:
+            # The JSON was produced by a validated figure, so skip Plotly's validation
+            return go.Figure(json.loads(figure_json), _validate=False)
+        metrics.count('cache_misses', cache='figure')
+        fig = build()
+        if fig is not None:
+            self.put(key, fig.to_json())
+        return fig
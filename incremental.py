@@ -0,0 +1,276 @@
+# incremental.py - Incremental refresh of cached datasets when their CSV file changes
+#
+# FSO adds a week at a time. Rather than re-parsing the whole history, each
+# loaded CSV dataset is tracked with its file size, modification time, a hash
+# of its contents and a hash per data line.
+# When the file changes, only the delta is parsed:
+# - appended rows: the old file is an unchanged prefix of the new one (the
+#   region file, sorted by TIME_PERIOD) -> parse the bytes after the old end
+# - changed rows: new lines whose hash was not seen before (the weekly file,
+#   which is sorted by age group, ships future weeks with '.' placeholders and
+#   revises the extrapolated last weeks) -> parse just those lines
+# The delta rows replace rows with the same key (e.g. Year/Week/Age) or are
+# appended. The memoized weekly totals and region cube are updated from the
+# delta, and the merged frame is written to the columnar cache under the new
+# file's key. Anything else (rows removed, header changed, filtered/Excel
+# sources, files folded into an aggregate) falls back to a full reload through
+# columnar_cache.load_columnar.
+
+import hashlib
+import io
+import json
+import os
+import threading
+
+import pandas as pd
+
+import aggregates
+import metrics
+from columnar_cache import cache_key, cache_path, file_digest, load_columnar, read_cached, write_cached
+from cube import DataCube
+from dialect import sniff_csv
+from region_query import RegionIndex
+from streaming import STREAMING_THRESHOLD_BYTES, concat_chunks
+
+LINE_HASH_MAX_BYTES = 64 * 1024 * 1024  # Larger files only get the append check
+ROW_KEYS = [['TIME_PERIOD', 'GEO', 'AGE', 'SEX'], ['Year', 'Week', 'Age']]  # First match identifies a row
+
+
+class SourceState:
+    """
+    What is known about a loaded file: its frame and enough of its bytes to find
+    a delta. If the file no longer matches the frame's data version (it changed
+    after the frame was loaded), the state has no signature and only allows a
+    full reload, so the next latest() call replaces the stale frame.
+    """
+
+    def __init__(self, full_path, options, frame):
+        self.full_path, self.options, self.frame = full_path, options, frame
+        stat = os.stat(full_path)
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        self.size = stat.st_size
+        self.key_columns = None  # None = only full reloads
+        self.digest = file_digest(full_path)  # Of the whole file; an append must keep it as its prefix
+        if aggregates.data_version(frame) != cache_key(full_path, options, self.digest):
+            self.signature = None
+            return
+        if not _incremental(full_path, options):
+            return
+        self.key_columns = next((cols for cols in ROW_KEYS if all(c in frame.columns for c in cols)), None)
+        self.comment = sniff_csv(full_path)['comment']
+        with open(full_path, 'rb') as f:
+            self.header = _strip_bom(f.readline())
+            self.line_hashes = None
+            if self.size <= LINE_HASH_MAX_BYTES:
+                f.seek(0)
+                self.line_hashes = set(map(hash, _data_lines(f, self.comment)))
+            f.seek(max(0, self.size - 1))
+            self.ends_with_newline = f.read(1) == b'\n'
+        stat = os.stat(full_path)
+        if (stat.st_size, stat.st_mtime_ns) != self.signature:  # Changed while it was being read
+            self.signature, self.key_columns = None, None
+
+
+def _incremental(full_path, options):
+    """Only plain CSV loads can be refreshed incrementally (no filters, chunks, custom loader or folded aggregate)."""
+    if options.get('aggregate') and os.path.getsize(full_path) > STREAMING_THRESHOLD_BYTES:
+        return False  # Loaded as the aggregate's frame, not as rows (streaming.read_csv_aggregated)
+    return (full_path.lower().endswith('.csv')
+            and not any(options.get(k) for k in ('is_excel', 'filters', 'chunksize', 'loader')))
+
+
+def _strip_bom(line):
+    return line[3:] if line.startswith(b'\xef\xbb\xbf') else line
+
+
+def _prefix_digest(f, end):
+    """sha256 hex digest of the first end bytes of an open file (file_digest of the old file for an append)."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    remaining = end
+    while remaining > 0:
+        block = f.read(min(1 << 20, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest.hexdigest()
+
+
+def _data_lines(f, comment):
+    """Data lines of an open file (header, blank and comment lines skipped), newline-terminated."""
+    f.readline()
+    prefix = comment.encode() if comment else None
+    for line in f:
+        if line.strip() and not (prefix and line.startswith(prefix)):
+            yield line if line.endswith(b'\n') else line + b'\n'
+
+
+# --- Finding and parsing the delta ---
+
+def _parse_lines(state, header, body):
+    """Parses header + body with the file's sniffed dialect and dtypes."""
+    kwargs = sniff_csv(state.full_path)
+    kwargs['encoding'] = 'utf-8'  # The BOM was stripped from header
+    if state.options.get('specific_delimiter'):
+        kwargs['sep'] = state.options['specific_delimiter']
+    if state.options.get('decimal_separator'):
+        kwargs['decimal'] = state.options['decimal_separator']
+    return pd.read_csv(io.BytesIO(header + body), engine='c', **kwargs)
+
+
+def read_delta(state):
+    """
+    Returns (mode, delta rows, number of old data lines that disappeared) for a
+    changed file, or (None, None, None) when no delta can be found. Appended
+    rows may revise earlier rows with the same key, so nothing disappears then.
+    """
+    with open(state.full_path, 'rb') as f:
+        header = _strip_bom(f.readline())
+        if header != state.header:
+            return None, None, None
+        size = os.fstat(f.fileno()).st_size
+        if size > state.size and state.ends_with_newline and _prefix_digest(f, state.size) == state.digest:
+            f.seek(state.size)
+            return 'append', _parse_lines(state, header, f.read()), None
+        if state.line_hashes is None or size > LINE_HASH_MAX_BYTES:
+            return None, None, None
+        f.seek(0)
+        lines = list(_data_lines(f, state.comment))
+    hashes = set(map(hash, lines))
+    changed = [line for line in lines if hash(line) not in state.line_hashes]
+    removed = len(state.line_hashes - hashes)
+    return 'rows', _parse_lines(state, header, b''.join(changed)), removed
+
+
+def _key_index(frame, key_columns):
+    return pd.MultiIndex.from_frame(frame[key_columns].astype(str))
+
+
+def upsert(frame, delta, key_columns):
+    """Returns (frame with delta's rows replacing same-key rows and the rest appended, rows replaced)."""
+    if not len(delta):
+        return frame, 0
+    replaced = _key_index(frame, key_columns).isin(_key_index(delta, key_columns))
+    kept = frame[~replaced] if replaced.any() else frame
+    parts = []
+    for part in (kept, delta):
+        # Cast delta columns to the cached dtypes so categoricals can be merged
+        columns = {}
+        for col in frame.columns:
+            series = part[col] if col in part.columns else pd.Series(pd.NA, index=part.index)
+            if isinstance(frame[col].dtype, pd.CategoricalDtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+            elif series.dtype != frame[col].dtype and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+                series = series.astype(frame[col].dtype)
+            columns[col] = series.reset_index(drop=True)
+        parts.append(pd.DataFrame(columns))
+    return concat_chunks(parts), int(replaced.sum())
+
+
+# --- Refresh ---
+
+def _update_aggregates(old_version, new_version, merged, delta):
+    """Carries the memoized aggregates of the old data version over to the new one."""
+    totals = aggregates.cached_result('weekly_totals', old_version)
+    if totals is not None and {'Year', 'Week'}.issubset(delta.columns):
+        aggregates.store_result('weekly_totals', new_version,
+                                aggregates.update_weekly_totals(totals, merged, delta))
+    cube = aggregates.cached_result('region_cube', old_version)
+    if cube is not None and 'TIME_PERIOD' in delta.columns and len(delta):
+        aggregates.store_result('region_cube', new_version,
+                                cube.updated(DataCube.from_index(RegionIndex.from_frame(delta))))
+
+
+def refresh(state):
+    """Brings state.frame up to date with the file, parsing only the delta where possible."""
+    old_version = state.frame.attrs.get('data_version')
+    mode, delta, removed = (None, None, None)
+    if state.key_columns is not None:
+        try:
+            mode, delta, removed = read_delta(state)
+        except (ValueError, pd.errors.ParserError) as e:
+            print(f"Could not parse the changes to {state.full_path} ({e}), reloading it fully")
+
+    if mode is not None:
+        try:
+            merged, replaced = upsert(state.frame, delta, state.key_columns)
+        except (ValueError, TypeError) as e:  # Delta values that don't fit the cached dtypes
+            print(f"Could not merge the changes to {state.full_path} ({e}), reloading it fully")
+            merged, replaced = None, 0
+        # A changed line must replace its old version; anything else means rows
+        # were deleted, which only a full reload reflects
+        if merged is not None and (removed is None or replaced == removed):
+            key = cache_key(state.full_path, state.options)
+            typed = write_cached(state.full_path, state.options, merged, key)
+            frame = read_cached(state.full_path, state.options, key)
+            frame = typed if frame is None else frame
+            aggregates.set_data_version(frame, key)
+            _update_aggregates(old_version, key, frame, delta)
+            _remove_cache_entry(state.full_path, old_version, key)
+            metrics.count('incremental_refreshes', mode=mode)
+            print(f"Refreshed {os.path.basename(state.full_path)}: {len(delta)} changed rows ({mode})")
+            return SourceState(state.full_path, state.options, frame)
+
+    metrics.count('incremental_refreshes', mode='full')
+    frame = load_columnar(state.full_path, **state.options)
+    _remove_cache_entry(state.full_path, old_version, aggregates.data_version(frame))
+    return SourceState(state.full_path, state.options, frame)
+
+
+def _remove_cache_entry(full_path, old_version, new_version):
+    """Deletes the cache file of the superseded data version, so each refresh doesn't leave one behind."""
+    if old_version and old_version != new_version:
+        try:
+            os.remove(cache_path(full_path, old_version))
+        except OSError:
+            pass  # Already gone, or still mapped by another process on Windows
+
+
+# --- Process-wide registry ---
+
+_sources = {}
+_source_locks = {}  # Source name -> lock held while that source is checked or refreshed
+_sources_lock = threading.Lock()  # Guards _sources and _source_locks lookups, never held during a refresh
+
+
+def _source_name(full_path, options):
+    return full_path, json.dumps(options, sort_keys=True, default=str)
+
+
+def track(full_path, options, frame):
+    """
+    Registers a frame right after load_columnar returned it, so later changes
+    to the file are found by latest() even before its first call.
+    """
+    name = _source_name(full_path, options)
+    with _sources_lock:
+        if name in _sources:
+            return
+    state = SourceState(full_path, options, frame)  # Reads the file, so outside the lock
+    with _sources_lock:
+        _sources.setdefault(name, state)
+
+
+def latest(full_path, options, frame):
+    """
+    Returns the up-to-date frame for a dataset first loaded as frame, refreshing
+    it if the file changed since. Costs one os.stat per call when nothing changed.
+    One session refreshes a source while the others wait for its result; other
+    sources stay available meanwhile.
+    """
+    name = _source_name(full_path, options)
+    with _sources_lock:
+        lock = _source_locks.setdefault(name, threading.Lock())
+    with lock:
+        with _sources_lock:
+            state = _sources.get(name)
+        if state is None:
+            state = SourceState(full_path, options, frame)
+        stat = os.stat(full_path)
+        if (stat.st_size, stat.st_mtime_ns) != state.signature:
+            with metrics.stage('refresh', file=os.path.basename(full_path)):
+                state = refresh(state)
+        with _sources_lock:
+            _sources[name] = state
+        return state.frame
@@ -0,0 +1,46 @@
+# loaders.py - Plain pandas readers for the files in data/ (no Streamlit calls)
+
+import os
+import pandas as pd
+
+from causes import read_causes_workbook
+from dialect import read_csv_sniffed
+from streaming import (DEFAULT_CHUNKSIZE, STREAMING_THRESHOLD_BYTES, downcast, read_csv_aggregated,
+                       read_csv_streaming)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_source(full_path, is_excel=False, specific_delimiter=None, decimal_separator=None,
+                filters=None, chunksize=None, loader=None, aggregate=None):
+    """
+    Reads a CSV or Excel file into a DataFrame, raising on failure.
+    CSV files are parsed once, already typed, with the dialect (delimiter,
+    decimal mark, BOM, comment lines, NA tokens, dtypes) detected by
+    dialect.sniff_csv; specific_delimiter/decimal_separator override it.
+    CSV files are read in chunks (streaming.py) when chunksize or filters are
+    given or the file is larger than STREAMING_THRESHOLD_BYTES; filters such as
+    {'years': (2020, 2023), 'GEO': ['CH04']} are applied while reading.
+    A streamed file with aggregate='weekly_totals' or 'region_cube' is folded
+    into that aggregate chunk by chunk instead of being kept as rows (streaming.py).
+    Integer and text columns are downcast the same way whether streamed or not.
+    loader='causes' reads an FSO cause-of-death workbook into a tidy long table.
+    """
+    if loader == 'causes':
+        return read_causes_workbook(full_path)
+    if loader is not None:
+        raise ValueError(f"Unknown loader {loader!r} for {full_path}")
+
+    if is_excel or full_path.lower().endswith('.xlsx'):
+        return pd.read_excel(full_path)
+
+    if not full_path.lower().endswith('.csv'):
+        raise ValueError(f"Unsupported file format: {full_path}")
+
+    if chunksize or filters or os.path.getsize(full_path) > STREAMING_THRESHOLD_BYTES:
+        if aggregate is not None:
+            return read_csv_aggregated(full_path, aggregate, filters, chunksize or DEFAULT_CHUNKSIZE,
+                                       specific_delimiter, decimal_separator)
+        return read_csv_streaming(full_path, filters, chunksize or DEFAULT_CHUNKSIZE,
+                                  specific_delimiter, decimal_separator)
+    return downcast(read_csv_sniffed(full_path, specific_delimiter, decimal_separator))
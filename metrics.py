@@ -0,0 +1,196 @@
+# metrics.py - Lightweight timing/memory instrumentation for the render path
+#
+# app.py wraps the stages of every rerun (load_data, aggregations, the
+# create_*_plot call, figure serialization) in metrics.stage(...), and the data
+# caches count their lookups and misses with metrics.count(...). Everything is
+# kept in process memory and can be exported three ways:
+# - the sidebar performance panel in app.py (stages of the current rerun)
+# - one JSON log line per rerun on the 'mortality.metrics' logger
+#   (set METRICS_LOG=1)
+# - a Prometheus text endpoint on http://<METRICS_HOST>:<METRICS_PORT>/metrics
+#   (METRICS_HOST defaults to 127.0.0.1)
+#
+# Memory is only measured when METRICS_TRACEMALLOC=1, since tracemalloc slows
+# pandas down noticeably. tracemalloc has one process-wide peak, so only the
+# outermost stage of a thread records it, and only while no stage in another
+# thread (a concurrent session, the background loader) is measuring: nested
+# stages and stages overlapping a measured one get no peak. A peak is the
+# stage's own high-water mark (traced memory at its start is subtracted), but
+# allocations made outside stages by other threads still count towards it.
+
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG_ENABLED = os.environ.get('METRICS_LOG') == '1'
+TRACE_MEMORY = os.environ.get('METRICS_TRACEMALLOC') == '1'
+HTTP_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')  # Set to 0.0.0.0 to expose /metrics beyond this host
+
+logger = logging.getLogger('mortality.metrics')
+if LOG_ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_lock = threading.Lock()  # Guards _counters and _stages (sessions and loader threads record concurrently)
+_counters = {}  # (name, labels) -> count
+_stages = {}    # (name, labels) -> {'count', 'seconds', 'max_seconds', 'max_peak_bytes'}
+_local = threading.local()  # Stage records of the rerun running in this thread, stage depth
+_peak_owner = threading.Lock()  # Held by the one stage whose peak is being measured
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+# --- Recording ---
+
+def count(name, n=1, **labels):
+    """Adds n to the counter name{labels}, e.g. count('cache_misses', cache='columnar')."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def start_run(**labels):
+    """Starts a new rerun in this thread; finish_run() returns the stages recorded until then."""
+    _local.run = {'labels': _labels(labels), 'started': time.perf_counter(), 'stages': []}
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Times the enclosed block; with METRICS_TRACEMALLOC=1 an outermost stage also
+    records its peak traced memory above what was traced when it started, if no
+    other thread's stage is measuring.
+    """
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    measure = TRACE_MEMORY and depth == 0 and _peak_owner.acquire(blocking=False)
+    if measure:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_traced = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _local.depth = depth
+        peak = None
+        if measure:
+            peak = tracemalloc.get_traced_memory()[1] - start_traced
+            _peak_owner.release()
+        key = (name, _labels(labels))
+        with _lock:
+            totals = _stages.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                              'max_peak_bytes': 0})
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['max_seconds'] = max(totals['max_seconds'], seconds)
+            if peak is not None:
+                totals['max_peak_bytes'] = max(totals['max_peak_bytes'], peak)
+        run = getattr(_local, 'run', None)
+        if run is not None:
+            run['stages'].append({'name': name, 'labels': dict(key[1]), 'seconds': seconds, 'peak_bytes': peak})
+
+
+def finish_run():
+    """Ends the current rerun, logs it as one JSON line if METRICS_LOG=1 and returns its stages."""
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return []
+    _local.run = None
+    if LOG_ENABLED:
+        logger.info(json.dumps({'event': 'rerun', **dict(run['labels']),
+                                'seconds': round(time.perf_counter() - run['started'], 6),
+                                'stages': run['stages']}))
+    return run['stages']
+
+
+def cache_stats():
+    """{cache: (lookups, misses)} from the 'cache_lookups' / 'cache_misses' counters."""
+    stats = {}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            cache = dict(labels).get('cache')
+            if cache is None or name not in ('cache_lookups', 'cache_misses'):
+                continue
+            lookups, misses = stats.get(cache, (0, 0))
+            stats[cache] = (lookups + value, misses) if name == 'cache_lookups' else (lookups, misses + value)
+    return stats
+
+
+def reset():
+    """Drops all counters and stage totals."""
+    with _lock:
+        _counters.clear()
+        _stages.clear()
+
+
+# --- Prometheus text format ---
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def prometheus_text():
+    """All counters and stage totals in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        stages = sorted((key, dict(totals)) for key, totals in _stages.items())
+
+    lines = []
+    for name in sorted({name for (name, _), _ in counters}):
+        lines.append(f"# TYPE mortality_{name}_total counter")
+        lines.extend(f"mortality_{name}_total{_format_labels(labels)} {value}"
+                     for (n, labels), value in counters if n == name)
+
+    lines.append("# TYPE mortality_stage_seconds summary")
+    for (name, labels), totals in stages:
+        stage_labels = _format_labels((('stage', name),) + labels)
+        lines.append(f"mortality_stage_seconds_count{stage_labels} {totals['count']}")
+        lines.append(f"mortality_stage_seconds_sum{stage_labels} {totals['seconds']:.6f}")
+    lines.append("# TYPE mortality_stage_seconds_max gauge")
+    lines.extend(f"mortality_stage_seconds_max{_format_labels((('stage', name),) + labels)} "
+                 f"{totals['max_seconds']:.6f}" for (name, labels), totals in stages)
+    if TRACE_MEMORY:
+        lines.append("# TYPE mortality_stage_peak_bytes_max gauge")
+        lines.extend(f"mortality_stage_peak_bytes_max{_format_labels((('stage', name),) + labels)} "
+                     f"{totals['max_peak_bytes']}" for (name, labels), totals in stages
+                     if totals['max_peak_bytes'])  # Stages that only ran nested have no peak
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # Keep scrapes out of the Streamlit log
+        pass
+
+
+def start_http_server(port, host=HTTP_HOST):
+    """Serves /metrics from a daemon thread and returns the server (raises OSError if the port is taken)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
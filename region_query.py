@@ -0,0 +1,168 @@
+# region_query.py - Indexed slice queries over the weekly region/age/sex dataset
+#
+# Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv has one row per
+# (TIME_PERIOD, GEO, AGE, SEX). RegionIndex parses TIME_PERIOD ("2024-W01") into
+# integer year/week once, encodes GEO/AGE/SEX as small-int codes and sorts the
+# rows by one composite key, so a slice such as
+#     CH04, Y80T84 + Y85T89, F, 2020-2023
+# is a handful of binary searches (one contiguous block per geo/age/sex
+# combination) instead of boolean-mask scans over every row.
+
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from aggregates import memoized
+
+# Display order of the codes; values not listed here are appended in sorted order
+GEO_ORDER = ['CH', 'CH01', 'CH02', 'CH03', 'CH04', 'CH05', 'CH06', 'CH07']
+AGE_ORDER = ['_T', 'Y0T4', 'Y5T9', 'Y10T14', 'Y15T19', 'Y20T24', 'Y25T29', 'Y30T34', 'Y35T39',
+             'Y40T44', 'Y45T49', 'Y50T54', 'Y55T59', 'Y60T64', 'Y65T69', 'Y70T74', 'Y75T79',
+             'Y80T84', 'Y85T89', 'Y_GE90']
+SEX_ORDER = ['T', 'M', 'F']
+
+# Codes of the rows that hold the totals the file ships with
+TOTAL_GEO, TOTAL_AGE, TOTAL_SEX = 'CH', '_T', 'T'
+
+GEO_NAMES = {
+    'CH': "Switzerland",
+    'CH01': "Lake Geneva region",
+    'CH02': "Espace Mittelland",
+    'CH03': "Northwestern Switzerland",
+    'CH04': "Zurich",
+    'CH05': "Eastern Switzerland",
+    'CH06': "Central Switzerland",
+    'CH07': "Ticino",
+}
+SEX_NAMES = {'T': "Total", 'M': "Men", 'F': "Women"}
+
+
+def age_label(code):
+    """'Y80T84' -> '80-84', 'Y_GE90' -> '90+', '_T' -> 'All ages'."""
+    if code == TOTAL_AGE:
+        return "All ages"
+    if code.startswith('Y_GE'):
+        return f"{code[4:]}+"
+    low, _, high = code[1:].partition('T')
+    return f"{low}-{high}"
+
+
+def parse_time_periods(values):
+    """Splits ISO week labels like '2024-W01' into integer (year, week) arrays."""
+    values = pd.Series(values, dtype=str)
+    parts = values.str.extract(r'^(\d{4})-W(\d{1,2})$')
+    if parts.isna().any().any():
+        bad = values[parts.isna().any(axis=1)].iloc[0]
+        raise ValueError(f"Unexpected TIME_PERIOD value {bad!r}, expected e.g. '2024-W01'")
+    return parts[0].astype(int).to_numpy(), parts[1].astype(int).to_numpy()
+
+
+def _encode(values, order):
+    """Returns (codes, labels) with labels in the given display order."""
+    present = set(pd.unique(np.asarray(values, dtype=object)))
+    labels = [v for v in order if v in present] + sorted(present - set(order))
+    codes = pd.Categorical(values, categories=labels).codes.astype(np.int16)
+    return codes, labels
+
+
+class RegionIndex:
+    """Sorted, integer-coded view of the region dataset for fast slice queries."""
+
+    def __init__(self, geo, age, sex, time, values, geo_labels, age_labels, sex_labels, years, weeks):
+        self.geo_labels, self.age_labels, self.sex_labels = geo_labels, age_labels, sex_labels
+        self.years, self.weeks = years, weeks  # Per time slot, sorted chronologically
+        self.year_week = years * 100 + weeks
+        self.time_labels = np.array([f"{y}-W{w:02d}" for y, w in zip(years, weeks)], dtype=object)
+        self.shape = (len(geo_labels), len(age_labels), len(sex_labels), len(years))
+
+        key = self._key(geo.astype(np.int64), age.astype(np.int64), sex.astype(np.int64), time.astype(np.int64))
+        order = np.argsort(key, kind='stable')
+        self.key = key[order]
+        self.geo, self.age, self.sex, self.time = geo[order], age[order], sex[order], time[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_frame(cls, dataframe):
+        """Builds the index from the raw frame (columns TIME_PERIOD, GEO, AGE, SEX, OBS_VALUE)."""
+        required_cols = ['TIME_PERIOD', 'GEO', 'AGE', 'SEX', 'OBS_VALUE']
+        missing = [col for col in required_cols if col not in dataframe.columns]
+        if missing:
+            raise KeyError(f"Missing columns {missing}. Found: {dataframe.columns.tolist()}")
+
+        # TIME_PERIOD has few distinct values, so parse each label only once
+        periods = pd.Categorical(dataframe['TIME_PERIOD'])
+        years, weeks = parse_time_periods(periods.categories)
+        chronological = np.argsort(years * 100 + weeks, kind='stable')
+        slot_of_category = np.empty(len(chronological), dtype=np.int32)
+        slot_of_category[chronological] = np.arange(len(chronological))
+        time = slot_of_category[periods.codes]
+
+        geo, geo_labels = _encode(dataframe['GEO'], GEO_ORDER)
+        age, age_labels = _encode(dataframe['AGE'], AGE_ORDER)
+        sex, sex_labels = _encode(dataframe['SEX'], SEX_ORDER)
+        values = pd.to_numeric(dataframe['OBS_VALUE'], errors='coerce').to_numpy(dtype=float)
+        return cls(geo, age, sex, time, values, geo_labels, age_labels, sex_labels,
+                   years[chronological], weeks[chronological])
+
+    def _key(self, geo, age, sex, time):
+        _, n_age, n_sex, n_time = self.shape
+        return ((geo * n_age + age) * n_sex + sex) * n_time + time
+
+    def _codes(self, selected, labels):
+        if selected is None:
+            return range(len(labels))
+        if isinstance(selected, str):
+            selected = [selected]
+        lookup = {label: code for code, label in enumerate(labels)}
+        unknown = [s for s in selected if s not in lookup]
+        if unknown:
+            raise KeyError(f"Unknown codes {unknown}; known: {labels}")
+        return [lookup[s] for s in selected]
+
+    def time_slots(self, years=None):
+        """(first, last) time slot covering the inclusive year range, or None if empty."""
+        if years is None:
+            return 0, self.shape[3] - 1
+        first = int(np.searchsorted(self.year_week, years[0] * 100, side='left'))
+        last = int(np.searchsorted(self.year_week, years[1] * 100 + 99, side='right')) - 1
+        return (first, last) if first <= last else None
+
+    def query_positions(self, geo=None, age=None, sex=None, years=None):
+        """
+        Positions (into the sorted arrays) of the rows matching the filters.
+        geo/age/sex take a code or a list of codes (None = all); years is an
+        inclusive (first, last) tuple. Result is ordered by geo, age, sex, time.
+        """
+        slots = self.time_slots(years)
+        if slots is None:
+            return np.empty(0, dtype=np.int64)
+        blocks = []
+        for g, a, s in product(self._codes(geo, self.geo_labels),
+                               self._codes(age, self.age_labels),
+                               self._codes(sex, self.sex_labels)):
+            base = self._key(g, a, s, 0)
+            lo = np.searchsorted(self.key, base + slots[0], side='left')
+            hi = np.searchsorted(self.key, base + slots[1], side='right')
+            if hi > lo:
+                blocks.append(np.arange(lo, hi))
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+
+    def query(self, geo=None, age=None, sex=None, years=None):
+        """Matching rows as a DataFrame: Year, Week, Year-Week, GEO, AGE, SEX, OBS_VALUE."""
+        pos = self.query_positions(geo, age, sex, years)
+        time = self.time[pos]
+        return pd.DataFrame({
+            'Year': self.years[time],
+            'Week': self.weeks[time],
+            'Year-Week': self.time_labels[time],
+            'GEO': np.asarray(self.geo_labels, dtype=object)[self.geo[pos]],
+            'AGE': np.asarray(self.age_labels, dtype=object)[self.age[pos]],
+            'SEX': np.asarray(self.sex_labels, dtype=object)[self.sex[pos]],
+            'OBS_VALUE': self.values[pos],
+        })
+
+
+def region_index(dataframe):
+    """RegionIndex for the region frame, built once per data version."""
+    return memoized('region_index', dataframe, RegionIndex.from_frame)
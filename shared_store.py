@@ -0,0 +1,199 @@
+# shared_store.py - Versioned, memory-mapped dataset store shared by all worker processes
+#
+# Several Streamlit processes behind a load balancer would each parse and hold
+# every dataset. Instead, one publisher process writes the typed columns of all
+# datasets as Arrow IPC files into a new version directory and then swaps a
+# CURRENT pointer file (os.replace, atomic). Workers started with
+# DATASET_STORE_DIR set attach to the files of the current version read-only
+# through memory maps, so the operating system keeps a single copy of the data
+# in the page cache however many workers there are. When CURRENT changes,
+# workers attach to the new version on their next rerun; sessions still using
+# frames of the old version keep their mappings until they let go of them.
+#
+#     python shared_store.py publish                # publish once (skips if nothing changed)
+#     python shared_store.py publish --watch 60     # re-check the sources every minute
+#     python shared_store.py status
+#
+# Layout:
+#     <store>/CURRENT                     id of the current version
+#     <store>/versions/<id>/manifest.json dataset -> file, data version, rows
+#     <store>/versions/<id>/<dataset>.arrow
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from aggregates import set_data_version
+from columnar_cache import cache_path, load_columnar, pa, read_table, write_table
+from datasets import DATASETS
+from incremental import latest, track
+from loaders import DATA_DIR
+
+STORE_DIR = os.environ.get('DATASET_STORE_DIR') or os.path.join(DATA_DIR, '.store')
+KEEP_VERSIONS = 3  # Older versions are deleted after a publish
+
+
+# --- Publishing ---
+
+def current_version(root=STORE_DIR):
+    """Id of the published version, or None if nothing has been published."""
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(root, version):
+    with open(os.path.join(root, 'versions', version, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def _publish_file(frame, full_path, target):
+    """Hard-links the columnar cache file of frame into the version (no copy), or writes it."""
+    source = cache_path(full_path, frame.attrs['data_version'])
+    try:
+        os.link(source, target)
+    except OSError:  # No cache file (pyarrow-less cache, refreshed frame) or another file system
+        write_table(target, frame)
+
+
+def publish(frames, root=STORE_DIR, keep=KEEP_VERSIONS):
+    """
+    Publishes {dataset name: frame} as a new version and points CURRENT at it.
+    Returns the new version id, or None if every data version is unchanged.
+    """
+    versions = {name: frame.attrs['data_version'] for name, frame in frames.items()}
+    current = current_version(root)
+    if current is not None:
+        manifest = read_manifest(root, current)
+        if {name: entry['data_version'] for name, entry in manifest.items()} == versions:
+            return None
+
+    digest = hashlib.sha256(json.dumps(versions, sort_keys=True).encode()).hexdigest()[:8]
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{digest}"
+    directory = os.path.join(root, 'versions', version)
+    os.makedirs(directory)
+    manifest = {}
+    for name, frame in frames.items():
+        file_name = f"{name}.arrow"
+        _publish_file(frame, os.path.join(DATA_DIR, DATASETS[name]['file']), os.path.join(directory, file_name))
+        manifest[name] = {'file': file_name, 'data_version': versions[name], 'rows': len(frame)}
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    pointer = os.path.join(root, 'CURRENT')
+    with open(f"{pointer}.tmp", 'w') as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)  # Workers see either the old or the new version, never a mix
+    _prune(root, keep, version)
+    return version
+
+
+def _prune(root, keep, current):
+    versions = sorted(os.listdir(os.path.join(root, 'versions')))
+    for old in versions[:-keep]:
+        if old != current:
+            # Workers that still map these files keep their data until they drop it (POSIX unlink semantics)
+            shutil.rmtree(os.path.join(root, 'versions', old), ignore_errors=True)
+
+
+def load_sources(frames=None):
+    """
+    Loads every dataset whose file exists through the columnar cache; with the
+    frames of a previous call, only changed files are re-read (incremental.py).
+    Frames are registered as they are loaded, so a file changed before the next
+    call is refreshed then. A dataset that fails to load is reported and keeps
+    its previous frame (or is left out), so the others are still published.
+    """
+    loaded = {}
+    for name, spec in DATASETS.items():
+        full_path = os.path.join(DATA_DIR, spec['file'])
+        if not os.path.exists(full_path):
+            continue
+        previous = (frames or {}).get(name)
+        try:
+            if previous is None:
+                loaded[name] = load_columnar(full_path, **spec['options'])
+                track(full_path, spec['options'], loaded[name])
+            else:
+                loaded[name] = latest(full_path, spec['options'], previous)
+        except Exception as e:  # One bad file must not stop the publisher
+            kept = "keeping the previous version" if previous is not None else "not publishing it"
+            print(f"Could not load {name} from {spec['file']} ({e}), {kept}")
+            if previous is not None:
+                loaded[name] = previous
+    return loaded
+
+
+# --- Attaching (workers) ---
+
+class SharedStore:
+    """A worker's read-only view of the store; follows CURRENT from one call to the next."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.version = None
+        self._manifest = {}
+        self._frames = {}
+        self._lock = threading.Lock()  # Guards version, _manifest and _frames, swapped together on a new version
+
+    def get(self, name):
+        """The memory-mapped frame of a dataset in the current version, or None if it was not published."""
+        version = current_version(self.root)
+        if version is None:
+            return None
+        with self._lock:
+            if version != self.version:
+                self._manifest = read_manifest(self.root, version)
+                self._frames = {}  # Frames of the old version stay valid for whoever still holds them
+                self.version = version
+            if name not in self._frames:
+                entry = self._manifest.get(name)
+                if entry is None:
+                    return None
+                frame = read_table(os.path.join(self.root, 'versions', version, entry['file']))
+                set_data_version(frame, entry['data_version'])
+                self._frames[name] = frame
+            return self._frames[name]
+
+
+# --- Command line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish datasets to the shared memory-mapped store.")
+    parser.add_argument('command', choices=['publish', 'status'])
+    parser.add_argument('--store', default=STORE_DIR, help="store directory (default: $DATASET_STORE_DIR or data/.store)")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="keep publishing changes at this interval")
+    parser.add_argument('--keep', type=int, default=KEEP_VERSIONS, help="versions to keep on disk")
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        version = current_version(args.store)
+        if version is None:
+            print(f"Nothing published in {args.store}")
+            return 1
+        print(f"current  {version}")
+        for name, entry in sorted(read_manifest(args.store, version).items()):
+            print(f"         {name:16} {entry['rows']:>8} rows  {entry['data_version']}")
+        return 0
+
+    if pa is None:
+        sys.exit("pyarrow is required for the shared dataset store (pip install pyarrow)")
+    frames = None
+    while True:
+        frames = load_sources(frames)
+        version = publish(frames, args.store, args.keep)
+        print(f"published {version}" if version else f"unchanged {current_version(args.store)}")
+        if not args.watch:
+            return 0
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# streaming.py - Chunked CSV ingest with pushdown filters for large FSO extracts
+#
+# A full extract (all cantons, all years, weekly) is too big to load as one
+# object-dtype frame. These readers parse the file in chunks with the sniffed
+# dialect, drop unwanted rows (years, GEO, AGE, SEX) and downcast each chunk
+# right after it is read, so memory is bounded by the rows that are kept, not by
+# the size of the file.
+#
+# Datasets whose views only read an aggregate (the 'aggregate' option in
+# datasets.py) are not kept as rows at all: each chunk is folded into the
+# weekly totals or the region cube and dropped, so memory is bounded by the
+# size of the aggregate even without filters.
+
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from aggregates import WeeklyTotalsAccumulator
+from cube import DataCube
+from dialect import sniff_csv
+from region_query import RegionIndex
+
+DEFAULT_CHUNKSIZE = 200_000  # Rows per chunk
+STREAMING_THRESHOLD_BYTES = 64 * 1024 * 1024  # load_data streams files larger than this
+_NA_IN_COLUMN = re.compile(r'Integer column has NA values in column (\d+)')  # pandas C parser error
+
+
+def _year_column(chunk):
+    """Integer year of every row: the 'Year' column, or the first 4 characters of TIME_PERIOD."""
+    if 'Year' in chunk.columns:
+        return chunk['Year']
+    if 'TIME_PERIOD' in chunk.columns:
+        return pd.to_numeric(chunk['TIME_PERIOD'].astype(str).str[:4], errors='coerce')
+    return None
+
+
+def apply_filters(chunk, filters):
+    """
+    Keeps the rows of a chunk that match filters, a dict like
+    {'years': (2020, 2023), 'GEO': ['CH04'], 'AGE': ['Y80T84', 'Y85T89'], 'SEX': ['F']}.
+    Any key may be left out; column filters for columns the file lacks are ignored.
+    """
+    if not filters:
+        return chunk
+    mask = np.ones(len(chunk), dtype=bool)
+    years = filters.get('years')
+    if years is not None:
+        year = _year_column(chunk)
+        if year is not None:
+            mask &= year.between(years[0], years[1]).to_numpy()
+    for col, allowed in filters.items():
+        if col != 'years' and col in chunk.columns and allowed is not None:
+            mask &= chunk[col].isin(list(allowed)).to_numpy()
+    return chunk[mask]
+
+
+def downcast(chunk):
+    """
+    Shrinks a chunk: integers to int32 where they fit, low-cardinality text to
+    categoricals. Floats are left alone so rates keep their decimals exactly.
+    """
+    columns = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_integer_dtype(series) and len(series):
+            if series.min() >= np.iinfo(np.int32).min and series.max() <= np.iinfo(np.int32).max:
+                series = series.astype(np.int32)
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if series.nunique() <= max(1, len(series) // 2):
+                series = series.astype('category')
+        columns[col] = series
+    return pd.DataFrame(columns, index=chunk.index)
+
+
+def _relaxed(dtype, columns, error):
+    """
+    Sampled dtypes to retry with after error: the integer column it names as
+    float (it has missing values), else every integer column as float, else
+    none at all. Columns that did fit, such as Year and Week, stay integers.
+    """
+    match = _NA_IN_COLUMN.search(str(error))
+    if match and int(match.group(1)) < len(columns) and dtype.get(columns[int(match.group(1))]) == 'int64':
+        return {**dtype, columns[int(match.group(1))]: 'float64'}
+    if any(t == 'int64' for t in dtype.values()):
+        return {c: 'float64' if t == 'int64' else t for c, t in dtype.items()}
+    return {}
+
+
+def iter_chunks(full_path, filters=None, chunksize=DEFAULT_CHUNKSIZE,
+                specific_delimiter=None, decimal_separator=None):
+    """
+    Yields filtered, downcast chunks of a CSV file parsed with its sniffed dialect.
+    The dtypes come from a sample of the file; if a later chunk does not fit
+    them, the file is parsed again with relaxed dtypes (see read_csv_sniffed),
+    skipping the chunks that were already yielded.
+    """
+    kwargs = sniff_csv(full_path)
+    if specific_delimiter:
+        kwargs['sep'] = specific_delimiter
+    if decimal_separator:
+        kwargs['decimal'] = decimal_separator
+    done = 0  # Chunks already yielded (chunk boundaries don't depend on the dtypes)
+    while True:
+        try:
+            with pd.read_csv(full_path, engine='c', chunksize=chunksize, **kwargs) as reader:
+                for i, chunk in enumerate(reader):
+                    if i < done:
+                        continue
+                    done += 1
+                    chunk = apply_filters(chunk, filters)
+                    if len(chunk):
+                        yield downcast(chunk)
+            return
+        except (ValueError, TypeError) as e:
+            if not kwargs['dtype']:
+                raise
+            print(f"Sampled dtypes did not fit {full_path} ({e}), parsing it again with relaxed dtypes...")
+            columns = pd.read_csv(full_path, engine='c', nrows=0,
+                                  **{k: v for k, v in kwargs.items() if k != 'dtype'}).columns
+            kwargs['dtype'] = _relaxed(kwargs['dtype'], list(columns), e)
+
+
+def concat_chunks(chunks):
+    """Concatenates chunks, merging per-chunk categoricals instead of falling back to object."""
+    chunks = list(chunks)
+    if not chunks:
+        return None
+    columns = {}
+    for col in chunks[0].columns:
+        parts = [chunk[col] for chunk in chunks]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            columns[col] = pd.Series(union_categoricals([p.array for p in parts]), name=col)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def read_csv_streaming(full_path, filters=None, chunksize=DEFAULT_CHUNKSIZE,
+                       specific_delimiter=None, decimal_separator=None):
+    """Reads a CSV file chunk by chunk and returns only the filtered, downcast rows."""
+    df = concat_chunks(iter_chunks(full_path, filters, chunksize, specific_delimiter, decimal_separator))
+    if df is None:
+        raise ValueError(f"No rows of {full_path} match the filters {filters}")
+    return df
+
+
+# --- Aggregates folded from the chunks ---
+
+def fold_weekly_totals(chunks):
+    """Per-week sums of the weekly deaths chunks (see WeeklyTotalsAccumulator.sums)."""
+    accumulator = WeeklyTotalsAccumulator()
+    for chunk in chunks:
+        accumulator.add(chunk)
+    return accumulator.sums()
+
+
+def fold_region_cube(chunks):
+    """
+    The rows of the region/canton chunks rebuilt from their DataCube, which is
+    updated chunk by chunk (OBS_STATUS is dropped, a repeated row keeps its last value).
+    """
+    cube = None
+    for chunk in chunks:
+        part = DataCube.from_index(RegionIndex.from_frame(chunk))
+        cube = part if cube is None else cube.updated(part)
+    return downcast(cube.to_frame()) if cube is not None else None
+
+
+STREAMED_AGGREGATES = {'weekly_totals': fold_weekly_totals, 'region_cube': fold_region_cube}
+
+
+def read_csv_aggregated(full_path, aggregate, filters=None, chunksize=DEFAULT_CHUNKSIZE,
+                        specific_delimiter=None, decimal_separator=None):
+    """
+    Reads a CSV file chunk by chunk into the smallest frame that gives the same
+    aggregate ('weekly_totals' or 'region_cube') as the filtered rows.
+    """
+    if aggregate not in STREAMED_AGGREGATES:
+        raise ValueError(f"Unknown aggregate {aggregate!r} for {full_path}")
+    df = STREAMED_AGGREGATES[aggregate](iter_chunks(full_path, filters, chunksize, specific_delimiter,
+                                                    decimal_separator))
+    if df is None:
+        raise ValueError(f"No rows of {full_path} match the filters {filters}")
+    return df
@@ -0,0 +1,11 @@
+import pandas as pd
+
+from aggregates import data_version
+
+
+def test_content_hash_depends_on_column_names_and_row_order():
+    frame = pd.DataFrame({'Year': [2022, 2023], 'Deaths': [10, 12]})
+    assert data_version(frame) == data_version(frame.copy())
+    assert data_version(frame) != data_version(frame.rename(columns={'Deaths': 'Expected'}))
+    assert data_version(frame) != data_version(frame.iloc[::-1])
+    assert data_version(frame) != data_version(frame.astype({'Deaths': 'float64'}))
@@ -0,0 +1,12 @@
+import columnar_cache
+import benchmarks
+
+
+def test_benchmarks_run_at_default_scales(monkeypatch, capsys):
+    # run() points the columnar cache at its temporary directory; restore it afterwards
+    monkeypatch.setattr(columnar_cache, 'CACHE_DIR', columnar_cache.CACHE_DIR)
+    assert benchmarks.main(['--scales', '1', '10', '--repeat', '1']) == 0
+    out = capsys.readouterr().out
+    assert 'x10/aggregate/weekly_totals' in out
+    assert 'x10/figure/vis1/build' in out
+    assert "don't exist" not in out  # Synthetic years only get the ISO weeks they have
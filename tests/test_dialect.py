@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from dialect import read_csv_sniffed
+from loaders import DATA_DIR
+
+
+def _parse(file_name):
+    full_path = os.path.join(DATA_DIR, file_name)
+    if not os.path.exists(full_path):
+        pytest.skip(f"{file_name} not found")
+    with open(full_path, 'rb') as f:
+        raw = f.read()
+    return raw, read_csv_sniffed(full_path)
+
+
+def test_weekly_file_drops_legend_lines_and_placeholders():
+    raw, frame = _parse('Weekly_number_of_deaths.csv')
+    assert b'\n#' in raw and b'           .' in raw
+    data_lines = [line for line in raw.splitlines()[1:] if line.strip() and not line.startswith(b'#')]
+    assert len(frame) == len(data_lines)
+    assert frame['Year'].dtype == np.int64 and frame['Week'].dtype == np.int64
+    assert frame['NoDeaths_EP'].dtype == np.float64
+    assert frame['Diff'].dtype == np.float64
+    assert frame['Diff'].isna().any() and frame['Diff'].notna().any()
+    assert frame['NoDeaths_EP'].isna().any()  # Future weeks with only an expected value
+
+
+def test_rate_file_reads_quoted_decimal_commas_and_strips_the_bom():
+    raw, frame = _parse('Mortality_rate_per_100000_inhabitants.csv')
+    assert raw.startswith(b'\xef\xbb\xbf') and b'"1232,0"' in raw
+    assert list(frame.columns) == ['X.1', 'Men', 'Women']
+    assert frame['Men'].dtype == np.float64
+    first = frame[frame['X.1'] == 1970].iloc[0]
+    assert first['Men'] == 1232.0 and first['Women'] == pytest.approx(800.2)
+
+
+def test_region_file_handles_crlf_and_quotes():
+    raw, frame = _parse('Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv')
+    assert b'\r\n' in raw and raw.startswith(b'"TIME_PERIOD"')
+    assert list(frame.columns) == ['TIME_PERIOD', 'GEO', 'AGE', 'SEX', 'OBS_STATUS', 'OBS_VALUE']
+    assert frame['OBS_VALUE'].dtype == np.int64
+    assert frame.iloc[0][['TIME_PERIOD', 'GEO', 'AGE', 'SEX', 'OBS_STATUS']].tolist() == ['2024-W01', 'CH', '_T', 'T', 'P']
+    assert not frame['TIME_PERIOD'].astype(str).str.contains('[\r"]').any()
+
+
+def test_placeholder_first_seen_after_the_sample_stays_numeric(tmp_path):
+    lines = ["Year;Week;Age;NoDeaths_EP\n"]
+    lines += [f"{2000 + i // 104};{i % 52 + 1};{'0-64' if i % 2 else '65+'};{100 + i % 50}\n" for i in range(20_000)]
+    lines[10_000] = lines[10_000].rsplit(';', 1)[0] + ';.\n'  # Far past the head and tail samples
+    path = tmp_path / 'weekly.csv'
+    path.write_text(''.join(lines))
+    frame = read_csv_sniffed(str(path))
+    assert frame['NoDeaths_EP'].dtype == np.float64
+    assert frame['NoDeaths_EP'].isna().sum() == 1
+    assert frame['Year'].dtype == np.int64 and frame['Week'].dtype == np.int64
@@ -0,0 +1,186 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import aggregates
+import columnar_cache
+import incremental
+from columnar_cache import load_columnar
+from cube import DataCube, region_cube
+from region_query import RegionIndex
+
+HEADER = "Year;Week;Ending;Age;NoDeaths_EP;Expected;LowerB;UpperB;Diff\n"
+ROWS = [
+    "2022;1;09.01.2022;0-64    ;193;195;159;231;           .\n",
+    "2022;2;16.01.2022;0-64    ;198;195;159;231;           .\n",
+    "2022;3;23.01.2022;0-64    ;191;194;158;230;           .\n",
+    "2022;1;09.01.2022;65+     ;1210;1150;1010;1290;           .\n",
+    "2022;2;16.01.2022;65+     ;1185;1148;1008;1288;           .\n",
+    "2022;3;23.01.2022;65+     ;1402;1146;1006;1286;         116\n",
+]
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(incremental, '_sources', {})
+    aggregates.clear_memo()
+    path = tmp_path / 'weekly.csv'
+    path.write_text(HEADER + ''.join(ROWS))
+    return str(path)
+
+
+def _edit(path, old, new):
+    with open(path) as f:
+        text = f.read()
+    with open(path, 'w') as f:
+        f.write(text.replace(old, new))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))  # Coarse file system clocks
+
+
+def _deaths(frame, week, age):
+    row = frame[(frame['Week'] == week) & (frame['Age'].astype(str).str.strip() == age)]
+    return float(row['NoDeaths_EP'].iloc[0])
+
+
+def test_unchanged_file_returns_the_loaded_frame(source):
+    frame = load_columnar(source)
+    assert incremental.latest(source, {}, frame) is frame
+
+
+def test_file_changed_before_first_latest_call(source):
+    frame = load_columnar(source)
+    _edit(source, ';1185;', ';1999;')
+    assert _deaths(incremental.latest(source, {}, frame), 2, '65+') == 1999
+
+
+def test_file_changed_after_track(source):
+    frame = load_columnar(source)
+    incremental.track(source, {}, frame)
+    _edit(source, ';198;', ';250;')
+    refreshed = incremental.latest(source, {}, frame)
+    assert _deaths(refreshed, 2, '0-64') == 250
+    assert _deaths(refreshed, 2, '65+') == 1185
+    assert aggregates.weekly_totals(refreshed)['NoDeaths_EP'].sum() == sum(
+        [193, 250, 191, 1210, 1185, 1402])
+
+
+def test_track_of_a_stale_frame_reloads(source):
+    frame = load_columnar(source)
+    _edit(source, ';1402;', ';1500;')
+    incremental.track(source, {}, frame)
+    assert _deaths(incremental.latest(source, {}, frame), 3, '65+') == 1500
+
+
+def _region_lines(weeks, value=lambda week, geo, sex: week * 10 + len(geo) + len(sex)):
+    lines = []
+    for week in weeks:
+        for geo in ('CH', 'CH01', 'CH04'):
+            for sex in ('T', 'M', 'F'):
+                lines.append(f'"2024-W{week:02d}","{geo}","_T","{sex}","P","{value(week, geo, sex)}"\r\n')
+    return lines
+
+
+def test_appended_region_rows_update_the_cube(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(columnar_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(incremental, '_sources', {})
+    aggregates.clear_memo()
+    path = str(tmp_path / 'region.csv')
+    header = '"TIME_PERIOD","GEO","AGE","SEX","OBS_STATUS","OBS_VALUE"\r\n'
+    with open(path, 'w', newline='') as f:
+        f.write(header + ''.join(_region_lines(range(1, 5))))
+    frame = load_columnar(path)
+    incremental.track(path, {}, frame)
+    region_cube(frame)  # Memoized for the old data version, carried over by the refresh
+
+    # Two new weeks, plus a revision of an earlier week appended at the end
+    with open(path, 'a', newline='') as f:
+        f.write(''.join(_region_lines(range(5, 7))))
+        f.write('"2024-W02","CH04","_T","F","P","999"\r\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    refreshed = incremental.latest(path, {}, frame)
+
+    assert '19 changed rows (append)' in capsys.readouterr().out
+    assert len(refreshed) == 6 * 9
+    carried = aggregates.cached_result('region_cube', aggregates.data_version(refreshed))
+    assert carried is not None  # Updated from the delta, not rebuilt
+    rebuilt = DataCube.from_index(RegionIndex.from_frame(refreshed))
+    assert carried.labels == rebuilt.labels
+    np.testing.assert_array_equal(carried.years * 100 + carried.weeks, rebuilt.years * 100 + rebuilt.weeks)
+    np.testing.assert_array_equal(carried.values, rebuilt.values)
+    assert carried.slice(geo='CH04', age='_T', sex='F', years=(2024, 2024)).ravel()[1] == 999
+
+
+def test_revision_before_an_append_is_not_missed(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(columnar_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(incremental, '_sources', {})
+    aggregates.clear_memo()
+    path = str(tmp_path / 'region.csv')
+    header = '"TIME_PERIOD","GEO","AGE","SEX","OBS_STATUS","OBS_VALUE"\r\n'
+    lines = [line.replace('2024-', f'{year}-') for year in range(2020, 2025) for line in _region_lines(range(1, 53))]
+    with open(path, 'w', newline='') as f:
+        f.write(header + ''.join(lines))
+    assert os.path.getsize(path) > 64 * 1024  # The revised week lies far before the old end of file
+    frame = load_columnar(path)
+    incremental.track(path, {}, frame)
+
+    # A republish revises a provisional week near the start and appends a new one
+    lines[0] = lines[0].replace('"P","13"', '"P","93"')  # Same length, so later bytes don't move
+    with open(path, 'w', newline='') as f:
+        f.write(header + ''.join(lines + _region_lines([53])))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    refreshed = incremental.latest(path, {}, frame)
+
+    assert '(append)' not in capsys.readouterr().out
+    assert aggregates.data_version(refreshed) == columnar_cache.cache_key(path, {})
+    first = refreshed[(refreshed['TIME_PERIOD'] == '2020-W01') & (refreshed['GEO'] == 'CH')
+                      & (refreshed['SEX'] == 'T')]
+    assert first['OBS_VALUE'].tolist() == [93]
+
+
+def test_full_reload_removes_the_old_cache_file(source):
+    frame = load_columnar(source)
+    incremental.track(source, {}, frame)
+    old_file = columnar_cache.cache_path(source, aggregates.data_version(frame))
+    assert os.path.exists(old_file)
+    _edit(source, 'Diff\n', 'Difference\n')  # Header change: only a full reload reflects it
+    refreshed = incremental.latest(source, {}, frame)
+    assert 'Difference' in refreshed.columns
+    assert not os.path.exists(old_file)
+    assert os.listdir(columnar_cache.CACHE_DIR) == [os.path.basename(
+        columnar_cache.cache_path(source, aggregates.data_version(refreshed)))]
+
+
+def test_a_slow_refresh_does_not_block_other_sources(source, tmp_path, monkeypatch):
+    other = tmp_path / 'other.csv'
+    other.write_text(HEADER + ''.join(ROWS))
+    slow, fast = load_columnar(source), load_columnar(str(other))
+    incremental.track(source, {}, slow)
+    started, release = threading.Event(), threading.Event()
+    refresh = incremental.refresh
+
+    def blocking_refresh(state):
+        started.set()
+        release.wait(10)
+        return refresh(state)
+
+    monkeypatch.setattr(incremental, 'refresh', blocking_refresh)
+    _edit(source, ';198;', ';250;')
+    worker = threading.Thread(target=incremental.latest, args=(source, {}, slow))
+    worker.start()
+    try:
+        assert started.wait(10)
+        results = []
+        reader = threading.Thread(target=lambda: results.append(incremental.latest(str(other), {}, fast)))
+        reader.start()
+        reader.join(2)
+        assert results and results[0] is fast  # Returned while the other source was still refreshing
+    finally:
+        release.set()
+        worker.join(10)
+    assert _deaths(incremental.latest(source, {}, slow), 2, '0-64') == 250
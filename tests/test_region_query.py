@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loaders import DATA_DIR, read_source
+from region_query import RegionIndex
+
+REGION_FILE = os.path.join(DATA_DIR, 'Deaths_per_week_by_5-year_age_group_sex_and_major_region.csv')
+
+
+@pytest.fixture(scope='module')
+def frame():
+    if not os.path.exists(REGION_FILE):
+        pytest.skip("region data file not found")
+    return read_source(REGION_FILE)
+
+
+def _masked(frame, geo, age, sex, years=None):
+    """The same slice with plain boolean masks over every row."""
+    mask = (frame['GEO'].astype(str).isin(geo) & frame['AGE'].astype(str).isin(age)
+            & frame['SEX'].astype(str).isin(sex))
+    if years is not None:
+        year = frame['TIME_PERIOD'].astype(str).str[:4].astype(int)
+        mask &= year.between(*years)
+    rows = frame[mask]
+    return pd.DataFrame({
+        'Year-Week': rows['TIME_PERIOD'].astype(str).to_numpy(),
+        'GEO': rows['GEO'].astype(str).to_numpy(),
+        'AGE': rows['AGE'].astype(str).to_numpy(),
+        'SEX': rows['SEX'].astype(str).to_numpy(),
+        'OBS_VALUE': rows['OBS_VALUE'].to_numpy(dtype=float),
+    })
+
+
+def _sorted(df):
+    return df.sort_values(['GEO', 'AGE', 'SEX', 'Year-Week']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('geo, age, sex, years', [
+    (['CH04'], ['Y80T84', 'Y85T89'], ['F'], None),
+    (['CH01', 'CH07'], ['_T'], ['M', 'F'], (2024, 2024)),
+])
+def test_query_matches_boolean_masks(frame, geo, age, sex, years):
+    index = RegionIndex.from_frame(frame)
+    result = index.query(geo=geo, age=age, sex=sex, years=years)
+    expected = _masked(frame, geo, age, sex, years)
+    assert len(result) == len(expected) > 0
+    pd.testing.assert_frame_equal(_sorted(result[expected.columns].astype({'Year-Week': str})),
+                                  _sorted(expected), check_dtype=False)
+
+
+def test_query_outside_the_data_is_empty(frame):
+    index = RegionIndex.from_frame(frame)
+    assert index.query(geo='CH04', years=(1900, 1901)).empty
+    assert np.array_equal(index.query_positions(geo='CH04', years=(1900, 1901)), np.empty(0))
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+import aggregates
+import columnar_cache
+import incremental
+import shared_store
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(incremental, '_sources', {})
+    monkeypatch.setattr(shared_store, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(shared_store, 'DATASETS', {
+        'good': {'file': 'good.csv', 'options': {}, 'views': []},
+        'bad': {'file': 'bad.csv', 'options': {}, 'views': []},
+    })
+    aggregates.clear_memo()
+    (tmp_path / 'good.csv').write_text("Year,Deaths\n2022,10\n2023,12\n")
+    (tmp_path / 'bad.csv').write_text("Year,Deaths\n2022,10\n")
+    return tmp_path
+
+
+def test_a_failing_dataset_does_not_stop_the_publish(sources, monkeypatch, capsys):
+    read_source = columnar_cache.read_source
+
+    def failing(full_path, **options):
+        if full_path.endswith('bad.csv'):
+            raise ValueError("broken workbook")
+        return read_source(full_path, **options)
+
+    monkeypatch.setattr(columnar_cache, 'read_source', failing)
+    loaded = shared_store.load_sources()
+    assert list(loaded) == ['good']
+    assert 'Could not load bad' in capsys.readouterr().out
+    version = shared_store.publish(loaded, str(sources / 'store'))
+    assert list(shared_store.read_manifest(str(sources / 'store'), version)) == ['good']
+
+
+def test_a_failing_refresh_keeps_the_previous_frame(sources, monkeypatch):
+    frames = shared_store.load_sources()
+    monkeypatch.setattr(shared_store, 'latest', lambda *args: (_ for _ in ()).throw(pd.errors.ParserError("bad row")))
+    assert shared_store.load_sources(frames)['bad'] is frames['bad']
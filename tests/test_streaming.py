@@ -0,0 +1,76 @@
+import numpy as np
+
+from aggregates import clear_memo, weekly_totals
+from cube import DataCube
+from dialect import read_csv_sniffed
+from region_query import RegionIndex
+from streaming import read_csv_aggregated, read_csv_streaming
+
+N_ROWS = 20_000
+
+
+def _region_file(tmp_path, missing_row):
+    """A region-format CSV whose OBS_VALUE is empty on one row far outside the sniffed sample."""
+    lines = ["TIME_PERIOD,GEO,AGE,SEX,OBS_STATUS,OBS_VALUE\n"]
+    for i in range(N_ROWS):
+        value = '' if i == missing_row else str(i % 97)
+        lines.append(f"2024-W{i % 52 + 1:02d},CH0{i % 7 + 1},Y{i % 18 * 5}T{i % 18 * 5 + 4},F,P,{value}\n")
+    path = tmp_path / 'region.csv'
+    path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_streaming_recovers_from_wrong_sampled_dtypes(tmp_path):
+    path = _region_file(tmp_path, missing_row=N_ROWS // 2)
+    expected = read_csv_sniffed(path)
+    streamed = read_csv_streaming(path, chunksize=5000)
+    assert expected['OBS_VALUE'].dtype == np.float64
+    assert len(streamed) == N_ROWS
+    assert np.isnan(streamed['OBS_VALUE'].iloc[N_ROWS // 2])
+    np.testing.assert_array_equal(streamed['OBS_VALUE'].to_numpy(dtype=float),
+                                  expected['OBS_VALUE'].to_numpy(dtype=float))
+    assert (streamed['GEO'].astype(str) == expected['GEO'].astype(str)).all()
+
+
+def test_streaming_filters_after_a_retry(tmp_path):
+    path = _region_file(tmp_path, missing_row=N_ROWS * 3 // 4)
+    streamed = read_csv_streaming(path, filters={'GEO': ['CH04']}, chunksize=5000)
+    full = read_csv_sniffed(path)
+    assert len(streamed) == int((full['GEO'] == 'CH04').sum())
+    assert set(streamed['GEO'].astype(str)) == {'CH04'}
+
+
+def test_folded_region_cube_matches_the_rows(tmp_path):
+    path = _region_file(tmp_path, missing_row=N_ROWS // 3)
+    folded = read_csv_aggregated(path, 'region_cube', filters={'GEO': ['CH01', 'CH02']}, chunksize=3000)
+    rows = read_csv_streaming(path, filters={'GEO': ['CH01', 'CH02']}, chunksize=3000)
+    expected = DataCube.from_index(RegionIndex.from_frame(rows))
+    actual = DataCube.from_index(RegionIndex.from_frame(folded))
+    assert actual.labels == expected.labels
+    np.testing.assert_array_equal(actual.values, expected.values)
+
+
+def _weekly_file(tmp_path, missing_row):
+    """A weekly-format CSV whose NoDeaths_EP is a '.' placeholder on one row far outside the sniffed sample."""
+    lines = ["Year;Week;Ending;Age;NoDeaths_EP;Expected;LowerB;UpperB;Diff\n"]
+    for i in range(N_ROWS):
+        year, week, age = 2000 + i // 104, i // 2 % 52 + 1, '0-64    ' if i % 2 else '65+     '
+        deaths = '           .' if i == missing_row else str(100 + i % 50)
+        lines.append(f"{year};{week};01.01.{year};{age};{deaths};120;100;140;           .\n")
+    path = tmp_path / 'weekly.csv'
+    path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_streaming_keeps_year_and_week_integer_after_a_retry(tmp_path):
+    path = _weekly_file(tmp_path, missing_row=N_ROWS // 2)
+    streamed = read_csv_streaming(path, chunksize=5000)
+    folded = read_csv_aggregated(path, 'weekly_totals', chunksize=5000)
+    for frame in (streamed, folded):
+        assert np.issubdtype(frame['Year'].dtype, np.integer) and np.issubdtype(frame['Week'].dtype, np.integer)
+        assert frame['NoDeaths_EP'].dtype == np.float64
+    clear_memo()
+    totals = weekly_totals(folded)
+    assert totals['Year-Week'].iloc[0] == '2000-W01'
+    assert totals['Date'].notna().all()
+    assert len(totals) == N_ROWS // 2
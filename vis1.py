@@ -1,12 +1,22 @@
 # Updated vis1.py
 
-import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 
-def create_weekly_deaths_plot(dataframe):
+from aggregates import weekly_totals
+from downsample import DEFAULT_MAX_POINTS, downsample
+
+def create_weekly_deaths_plot(dataframe, show_expected=False, year_range=None, max_points=DEFAULT_MAX_POINTS,
+                              show_excess=False, age=None):
     """
     Generates the weekly deaths line plot, summing deaths across age groups.
     Expects columns 'Year', 'Week', 'NoDeaths_EP'.
+    With show_expected=True the 'Expected' line and the LowerB-UpperB band are overlaid;
+    show_excess=True marks the weeks the file's 'Diff' column flags (an age group above
+    its expected range) with the summed excess of the flagged age groups.
+    year_range=(first, last) limits the plot to those years; the visible weeks are
+    downsampled (LTTB) to max_points, so narrow ranges are shown at full resolution.
+    age (a list of 'Age' labels such as ['65+']) limits the sum to those age groups.
     """
     if dataframe is None or dataframe.empty:
         print("Warning in create_weekly_deaths_plot: Received empty or None data.")
@@ -22,37 +32,72 @@ def create_weekly_deaths_plot(dataframe):
             return None
 
         # --- Data Processing ---
-        # 1. Ensure 'NoDeaths_EP' is numeric, coercing errors to NaN
-        #    The '.' in your sample data needs handling.
-        dataframe['NoDeaths_EP'] = pd.to_numeric(dataframe['NoDeaths_EP'], errors='coerce')
-        # Optional: Drop rows where deaths couldn't be converted (or fill them e.g., with 0)
-        dataframe.dropna(subset=['NoDeaths_EP'], inplace=True)
-        dataframe['NoDeaths_EP'] = dataframe['NoDeaths_EP'].astype(int)
-
-
-        # 2. Group by Year and Week, summing deaths across age groups
-        weekly_totals = dataframe.groupby(['Year', 'Week'])['NoDeaths_EP'].sum().reset_index()
+        if age is not None:
+            if 'Age' not in dataframe.columns:
+                print("Error creating plot: Missing column 'Age' for the age filter")
+                return None
+            # Labels are blank-padded in the file ('0-64    ')
+            dataframe = dataframe[dataframe['Age'].astype(str).str.strip().isin(age)]
+            if dataframe.empty:
+                print(f"Warning in create_weekly_deaths_plot: No rows for age groups {age}.")
+                return None
+        # Weekly totals (numeric conversion, '.' placeholders dropped, grouped by Year/Week
+        # and sorted numerically) are computed once per data version in aggregates.py.
+        totals = weekly_totals(dataframe)
+        if year_range is not None:
+            totals = totals[totals['Year'].between(*year_range)]
+        invalid = totals['Date'].isna()
+        if invalid.any():
+            print(f"Warning in create_weekly_deaths_plot: skipping weeks that don't exist: "
+                  f"{', '.join(totals.loc[invalid, 'Year-Week'])}")
+            totals = totals[~invalid]
+        flagged = totals[totals['Diff'].notna()] if 'Diff' in totals.columns else totals.iloc[0:0]
+        n_observed = int(totals['NoDeaths_EP'].notna().sum())
+        observed = downsample(totals, 'NoDeaths_EP', max_points)
+        # Bands use the same kept weeks (plus future weeks without observations).
+        # The x axis is the date of each week, so the weeks LTTB dropped leave
+        # gaps of the right length instead of moving the kept ones closer together
+        totals = totals[totals.index.isin(observed.index) | totals['NoDeaths_EP'].isna()]
 
-        # 3. Create a combined Year-Week column for plotting (better for sorting)
-        #    Ensure week is zero-padded (e.g., W1 -> W01) for correct sorting
-        weekly_totals['Year-Week'] = weekly_totals['Year'].astype(str) + '-W' + weekly_totals['Week'].astype(str).str.zfill(2)
-        weekly_totals.sort_values('Year-Week', inplace=True) # Sort chronologically
+        title = "Total Weekly Deaths (All Ages)" if age is None else f"Weekly Deaths (Age {', '.join(age)})"
+        if len(observed) < n_observed:
+            title += f" - {len(observed)} of {n_observed} weeks shown, narrow the year range for full resolution"
 
         # --- Plotting ---
         fig = px.line(
-            weekly_totals,
-            x='Year-Week',
-            y='NoDeaths_EP',
-            title="Total Weekly Deaths (All Ages)",
+            x=observed['Date'],
+            y=observed['NoDeaths_EP'].astype(int),
+            title=title,
             labels={ # More descriptive labels
-                'Year-Week': 'Year and Week',
-                'NoDeaths_EP': 'Number of Deaths'
+                'x': 'Week',
+                'y': 'Number of Deaths'
             },
             markers=True # Optional: add markers to see individual points
         )
+        fig.update_traces(customdata=observed['Year-Week'], hovertemplate="%{customdata}<br>%{y:,} deaths<extra></extra>")
+
+        if show_expected and {'Expected', 'LowerB', 'UpperB'}.issubset(totals.columns):
+            fig.add_trace(go.Scatter(x=totals['Date'], y=totals['UpperB'], mode='lines',
+                                     line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=totals['Date'], y=totals['LowerB'], mode='lines',
+                                     line=dict(width=0), fill='tonexty', fillcolor='rgba(128,128,128,0.25)',
+                                     name='Expected range (99%)'))
+            fig.add_trace(go.Scatter(x=totals['Date'], y=totals['Expected'], mode='lines',
+                                     line=dict(dash='dash', color='gray'), name='Expected'))
+
+        if show_excess and len(flagged):
+            # The FSO flags each age group against its own band; the sum of the
+            # per-age bands is not the band of the total, so it is not used here.
+            # All flagged weeks are marked, including those LTTB left out.
+            fig.add_trace(go.Scatter(x=flagged['Date'], y=flagged['NoDeaths_EP'], mode='markers',
+                                     marker=dict(symbol='circle-open', size=10, color='red'),
+                                     name='Above expected range (FSO)',
+                                     customdata=flagged['Year-Week'],
+                                     text=[f"Excess in flagged age groups: {e:+,.0f}" for e in flagged['Diff']],
+                                     hovertemplate="%{customdata}<br>%{y:,.0f} deaths<br>%{text}<extra></extra>"))
 
         # Customize the plot further if needed
-        fig.update_layout(xaxis_title="Time (Year-Week)", yaxis_title="Total Deaths per Week")
+        fig.update_layout(xaxis_title="Time (ISO week)", yaxis_title="Total Deaths per Week")
 
         return fig # Return the Plotly figure object
 
@@ -60,4 +105,4 @@ def create_weekly_deaths_plot(dataframe):
         # Log the error for debugging
         print(f"An unexpected error occurred in create_weekly_deaths_plot: {e}")
         # Optionally re-raise or return None depending on desired app behavior
-        return None # Return None on error
\ No newline at end of file
+        return None # Return None on error
@@ -1,7 +1,5 @@
 # vis2.py - Simplified after fixing data loading
-import pandas as pd
 import plotly.express as px
-import streamlit as st # Keep for st.error/st.exception if needed
 
 def create_absolute_deaths_plot(dataframe):
     """
@@ -14,13 +12,14 @@ def create_absolute_deaths_plot(dataframe):
 
     try:
         # --- Data Preparation ---
-        df_processed = dataframe.copy()
+        # The input is the shared cached frame: derive new frames from it, never modify it
+        df_processed = dataframe
 
         # 1. Check for and rename the 'X.1' column (should exist now)
         if 'X.1' in df_processed.columns:
              df_processed = df_processed.rename(columns={'X.1': 'Year'})
         elif 'Year' not in df_processed.columns:
-             st.error("Error creating plot: Column 'X.1' or 'Year' not found after loading.")
+             print("Error creating plot: Column 'X.1' or 'Year' not found after loading.")
              print("Columns found:", df_processed.columns.tolist()) # Print to terminal if error occurs
              return None
 
@@ -28,14 +27,12 @@ def create_absolute_deaths_plot(dataframe):
         required_cols = ['Year', 'Men', 'Women']
         if not all(col in df_processed.columns for col in required_cols):
             missing = [col for col in required_cols if col not in df_processed.columns]
-            st.error(f"Error creating plot: Missing required columns {missing}. Found: {df_processed.columns.tolist()}")
+            print(f"Error creating plot: Missing required columns {missing}. Found: {df_processed.columns.tolist()}")
             return None
 
-        # 3. Convert columns to numeric types
-        for col in required_cols:
-             df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce')
-        df_processed.dropna(subset=required_cols, inplace=True)
-        df_processed['Year'] = df_processed['Year'].astype(int)
+        # 3. Columns arrive numeric from load_data (dialect.py); keep complete rows in a new frame
+        df_processed = df_processed[required_cols].dropna()
+        df_processed = df_processed.assign(Year=df_processed['Year'].astype(int))
 
         # 4. Melt the dataframe
         df_melted = df_processed.melt(id_vars=['Year'],
@@ -66,6 +63,5 @@ def create_absolute_deaths_plot(dataframe):
         return fig
 
     except Exception as e:
-        st.error(f"An unexpected error occurred in create_absolute_deaths_plot:")
-        st.exception(e) # Show full error in Streamlit app for easier debugging
-        return None
\ No newline at end of file
+        print(f"An unexpected error occurred in create_absolute_deaths_plot: {e}")
+        return None
@@ -1,7 +1,5 @@
 # vis3.py
-import pandas as pd
 import plotly.express as px
-import streamlit as st # Optional, for potential error messages
 
 def create_mortality_rate_plot(dataframe):
     """
@@ -14,13 +12,14 @@ def create_mortality_rate_plot(dataframe):
 
     try:
         # --- Data Preparation ---
-        df_processed = dataframe.copy()
+        # The input is the shared cached frame: derive new frames from it, never modify it
+        df_processed = dataframe
 
         # 1. Rename the 'X.1' column to 'Year'
         if 'X.1' in df_processed.columns:
              df_processed = df_processed.rename(columns={'X.1': 'Year'})
         elif 'Year' not in df_processed.columns:
-             st.error("Error creating plot: Column 'X.1' or 'Year' not found.")
+             print("Error creating plot: Column 'X.1' or 'Year' not found.")
              print("Columns found:", df_processed.columns.tolist())
              return None
 
@@ -28,25 +27,13 @@ def create_mortality_rate_plot(dataframe):
         required_cols = ['Year', 'Men', 'Women']
         if not all(col in df_processed.columns for col in required_cols):
             missing = [col for col in required_cols if col not in df_processed.columns]
-            st.error(f"Error creating plot: Missing required columns {missing}. Found: {df_processed.columns.tolist()}")
+            print(f"Error creating plot: Missing required columns {missing}. Found: {df_processed.columns.tolist()}")
             return None
 
-        # 3. Convert columns to numeric (should already be float due to load_data, but good practice to ensure)
-        #    No need for errors='coerce' if load_data worked correctly with decimal=','
-        try:
-            df_processed['Year'] = pd.to_numeric(df_processed['Year']) # Year should be convertible
-            df_processed['Men'] = pd.to_numeric(df_processed['Men'])
-            df_processed['Women'] = pd.to_numeric(df_processed['Women'])
-        except Exception as convert_e:
-             st.error(f"Error converting columns to numeric: {convert_e}. Check data types after loading.")
-             print("Data types before error:\n", df_processed.dtypes)
-             return None
-
-        # Optional: Check for NaNs introduced during conversion if errors='coerce' was used
-        # df_processed.dropna(subset=required_cols, inplace=True)
-
-        # Ensure Year is integer type for plotting axis
-        df_processed['Year'] = df_processed['Year'].astype(int)
+        # 3. Columns arrive numeric from load_data (dialect.py detects the decimal ','),
+        #    so only select them into a new frame and make Year an integer for the axis
+        df_processed = df_processed[required_cols]
+        df_processed = df_processed.assign(Year=df_processed['Year'].astype(int))
 
         # 4. Melt the dataframe to long format
         df_melted = df_processed.melt(id_vars=['Year'],
@@ -79,6 +66,5 @@ def create_mortality_rate_plot(dataframe):
         return fig # Return the Plotly figure object
 
     except Exception as e:
-        st.error(f"An unexpected error occurred in create_mortality_rate_plot:")
-        st.exception(e) # Show full error details in the Streamlit app
-        return None
\ No newline at end of file
+        print(f"An unexpected error occurred in create_mortality_rate_plot: {e}")
+        return None
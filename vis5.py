@@ -0,0 +1,108 @@
+# vis5.py - Weekly deaths by major region, age group and sex
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from cube import nan_sum, region_cube
+from downsample import DEFAULT_MAX_POINTS, downsample_groups
+from excess import slice_baseline
+from region_query import GEO_NAMES, SEX_NAMES, age_label
+
+def create_region_plot(dataframe, geo=('CH',), age=('_T',), sex=('T',), years=None, max_points=DEFAULT_MAX_POINTS,
+                       show_expected=False, baseline_years=None):
+    """
+    Generates a line plot of weekly deaths, one line per selected region and sex,
+    summing the selected age groups.
+    Expects columns 'TIME_PERIOD', 'GEO', 'AGE', 'SEX', 'OBS_VALUE'.
+    geo/age/sex are lists of codes (e.g. ['CH04'], ['Y80T84', 'Y85T89'], ['F']),
+    years an inclusive (first, last) tuple.
+    With show_expected=True each line gets its expected deaths and 99% band
+    (excess.py, fitted on baseline_years or all weeks), and weeks above the
+    band are marked with their excess deaths.
+    """
+    if dataframe is None or dataframe.empty:
+        print("Warning in create_region_plot: Received empty or None data.")
+        return None
+
+    if not geo or not age or not sex:
+        print("Warning in create_region_plot: Select at least one region, age group and sex.")
+        return None
+
+    try:
+        # --- Data Preparation ---
+        # The cube is built once per data version; filtering is plain array indexing
+        cube = region_cube(dataframe)
+        geo, age, sex = list(geo), list(age), list(sex)
+        block = cube.slice(geo=geo, age=age, sex=sex, years=years)  # [geo, age, sex, week]
+        if block.shape[3] == 0:
+            print("Warning in create_region_plot: No weeks in the selected year range.")
+            return None
+
+        # Sum the selected age groups per region, sex and week, then flatten to long format
+        totals = nan_sum(block, axis=1)  # [geo, sex, week]
+        n_geo, n_sex, n_weeks = totals.shape
+        weekly = pd.DataFrame({
+            'GEO': np.repeat(geo, n_sex * n_weeks),
+            'SEX': np.tile(np.repeat(sex, n_weeks), n_geo),
+            'Year-Week': np.tile(cube.time_labels[cube.time_range(years)], n_geo * n_sex),
+            'OBS_VALUE': totals.ravel(),
+        })
+        weekly['Series'] = weekly['GEO'].map(lambda g: GEO_NAMES.get(g, g)) + ", " + weekly['SEX'].map(lambda s: SEX_NAMES.get(s, s))
+        time_labels = weekly['Year-Week'].to_numpy()[:n_weeks]
+        series_names = weekly['Series'].to_numpy()[::n_weeks]
+        weekly = downsample_groups(weekly, 'OBS_VALUE', 'Series', max_points)
+
+        ages = "All ages" if list(age) == ['_T'] else ", ".join(age_label(a) for a in age)
+
+        # --- Plotting ---
+        fig = px.line(
+            weekly,
+            x='Year-Week',
+            y='OBS_VALUE',
+            color='Series',
+            title=f"Weekly Deaths by Major Region ({ages})",
+            labels={
+                'Year-Week': 'Year and Week',
+                'OBS_VALUE': 'Number of Deaths',
+                'Series': 'Region, Sex'
+            },
+            markers=True
+        )
+        fig.update_layout(
+            xaxis_title="Time (Year-Week)",
+            yaxis_title="Deaths per Week",
+            legend_title_text='Region, Sex'
+        )
+        if show_expected:
+            _add_expected(fig, slice_baseline(dataframe, geo, age, sex, years, baseline_years), series_names, time_labels)
+        fig.update_xaxes(categoryorder='array', categoryarray=sorted(time_labels))
+
+        return fig
+
+    except Exception as e:
+        print(f"An unexpected error occurred in create_region_plot: {e}")
+        return None
+
+
+def _add_expected(fig, baseline, series_names, time_labels):
+    """Adds the expected line, 99% band and excess-week markers of every series (baseline is [geo, sex, week])."""
+    colors = {trace.name: trace.line.color for trace in fig.data}
+    expected, lower, upper = (a.reshape(-1, len(time_labels)) for a in (baseline.expected, baseline.lower, baseline.upper))
+    observed, above = baseline.observed.reshape(expected.shape), baseline.above.reshape(expected.shape)
+    for i, name in enumerate(series_names):
+        color = colors.get(name, 'gray')
+        fig.add_trace(go.Scatter(x=time_labels, y=upper[i], mode='lines', line=dict(width=0),
+                                 legendgroup=name, showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=time_labels, y=lower[i], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor='rgba(128,128,128,0.2)', legendgroup=name, showlegend=False,
+                                 hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=time_labels, y=expected[i], mode='lines', line=dict(dash='dash', color=color),
+                                 legendgroup=name, name=f"{name} (expected)"))
+        weeks = np.flatnonzero(above[i])
+        if len(weeks):
+            fig.add_trace(go.Scatter(x=time_labels[weeks], y=observed[i, weeks], mode='markers',
+                                     marker=dict(symbol='circle-open', size=10, color='red'), legendgroup=name,
+                                     name=f"{name} (above 99% band)",
+                                     text=[f"Excess: {e:+,.0f}" for e in (observed[i, weeks] - expected[i, weeks])],
+                                     hovertemplate="%{x}<br>%{y:,.0f} deaths<br>%{text}<extra></extra>"))
@@ -0,0 +1,57 @@
+# vis6.py - Causes of death since 1970 (men)
+import plotly.express as px
+
+from causes import TOTAL_CAUSE
+
+def create_causes_men_plot(dataframe, measure='Deaths', show_sub_causes=False):
+    """
+    Generates a line plot of deaths (or age-standardised rates) per year, one line per cause.
+    Expects the tidy table from causes.read_causes_workbook: columns 'Year', 'Cause',
+    'Level', 'Deaths', 'Rate'. Only main causes are shown unless show_sub_causes=True.
+    """
+    if dataframe is None or dataframe.empty:
+        print("Warning in create_causes_men_plot: Received empty or None data.")
+        return None
+
+    try:
+        required_cols = ['Year', 'Cause', 'Level', measure]
+        if not all(col in dataframe.columns for col in required_cols):
+            missing = [col for col in required_cols if col not in dataframe.columns]
+            print(f"Error creating plot: Missing columns {missing}")
+            return None
+
+        # --- Data Preparation ---
+        # Drop the all-causes total (it would dwarf every other line) and, by default, sub-causes
+        keep = dataframe['Cause'] != TOTAL_CAUSE
+        if not show_sub_causes:
+            keep &= dataframe['Level'] == 0
+        df_plot = dataframe.loc[keep, ['Year', 'Cause', measure]].dropna(subset=[measure])
+        df_plot = df_plot.assign(Cause=df_plot['Cause'].astype(str))
+
+        measure_label = 'Number of Deaths' if measure == 'Deaths' else 'Deaths per 100,000 (age-standardised)'
+
+        # --- Plotting ---
+        fig = px.line(
+            df_plot,
+            x='Year',
+            y=measure,
+            color='Cause',
+            title="Causes of Death Since 1970 (Men)",
+            labels={
+                'Year': 'Year',
+                measure: measure_label,
+                'Cause': 'Cause of Death'
+            },
+            markers=True
+        )
+        fig.update_layout(
+            xaxis_title="Year",
+            yaxis_title=measure_label,
+            legend_title_text='Cause of Death'
+        )
+
+        return fig
+
+    except Exception as e:
+        print(f"An unexpected error occurred in create_causes_men_plot: {e}")
+        return None